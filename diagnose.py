@@ -5,12 +5,59 @@ This script verifies that all components are properly installed and configured.
 """
 
 import sys
+import io
 import os
-import subprocess
-import json
-import importlib
+import contextlib
+import functools
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional, Set
+
+# Module name the server package is loaded under by the diagnostics
+SERVER_PACKAGE = '_jinja2_html_server'
+
+# Zed extensions directory for this platform; macOS and Linux share the default
+ZED_EXTENSIONS_DIR = {
+    'win32': Path(os.environ.get('APPDATA', '')) / "Zed" / "extensions",
+}.get(sys.platform, Path.home() / ".config" / "zed" / "extensions")
+
+# Sample Zed settings.json snippet, pre-serialized since it never changes
+SAMPLE_ZED_CONFIG = """\
+{
+  "languages": {
+    "Jinja2 HTML": {
+      "language_servers": [
+        "jinja2-html-lsp"
+      ],
+      "format_on_save": "on",
+      "tab_size": 2,
+      "hard_tabs": false
+    }
+  },
+  "lsp": {
+    "jinja2-html-lsp": {
+      "binary": {
+        "path": "python",
+        "arguments": [
+          "-m",
+          "server.main"
+        ]
+      },
+      "settings": {
+        "jinja2": {
+          "enable_emmet": true,
+          "enable_jinja_snippets": true,
+          "auto_close_tags": true
+        }
+      }
+    }
+  }
+}"""
+
+# Manifest and grammar files larger than this are rejected before parsing
+MAX_CONFIG_FILE_SIZE = 1024 * 1024
+
+# Cached `zed --version` output, invalidated when the executable changes
+ZED_VERSION_CACHE = Path.home() / '.cache' / 'jinja2-html-diag' / 'zed-version.json'
 
 # ANSI color codes
 class Colors:
@@ -23,31 +70,52 @@ class Colors:
     WHITE = '\033[1;37m'
     NC = '\033[0m'  # No Color
 
+def _use_color() -> bool:
+    """Decide whether to emit ANSI colors, honoring NO_COLOR and FORCE_COLOR."""
+    if os.environ.get('NO_COLOR'):
+        return False
+    if os.environ.get('FORCE_COLOR'):
+        return True
+    return sys.stdout.isatty()
+
+# Plain output when piped to a file or CI log
+if not _use_color():
+    for _name in [name for name in vars(Colors) if name.isupper()]:
+        setattr(Colors, _name, '')
+
+# Message prefixes, built once instead of on every print
+_HEADER_RULE = f"{Colors.BLUE}{'='*60}{Colors.NC}"
+_HEADER_START = Colors.WHITE
+_HEADER_END = f"{Colors.NC}\n{_HEADER_RULE}"
+_PREFIX_OK = f"{Colors.GREEN}✓{Colors.NC} "
+_PREFIX_ERR = f"{Colors.RED}✗{Colors.NC} "
+_PREFIX_WARN = f"{Colors.YELLOW}⚠{Colors.NC} "
+_PREFIX_INFO = f"{Colors.CYAN}ℹ{Colors.NC} "
+_PREFIX_STEP = f"{Colors.PURPLE}→{Colors.NC} "
+
 def print_header(text: str):
     """Print a colored header."""
-    print(f"\n{Colors.BLUE}{'='*60}{Colors.NC}")
-    print(f"{Colors.WHITE}{text.center(60)}{Colors.NC}")
-    print(f"{Colors.BLUE}{'='*60}{Colors.NC}")
+    print("\n", _HEADER_RULE, "\n", _HEADER_START, text.center(60), _HEADER_END, sep='')
 
 def print_success(text: str):
     """Print success message."""
-    print(f"{Colors.GREEN}✓{Colors.NC} {text}")
+    print(_PREFIX_OK, text, sep='')
 
 def print_error(text: str):
     """Print error message."""
-    print(f"{Colors.RED}✗{Colors.NC} {text}")
+    print(_PREFIX_ERR, text, sep='')
 
 def print_warning(text: str):
     """Print warning message."""
-    print(f"{Colors.YELLOW}⚠{Colors.NC} {text}")
+    print(_PREFIX_WARN, text, sep='')
 
 def print_info(text: str):
     """Print info message."""
-    print(f"{Colors.CYAN}ℹ{Colors.NC} {text}")
+    print(_PREFIX_INFO, text, sep='')
 
 def print_step(text: str):
     """Print step message."""
-    print(f"{Colors.PURPLE}→{Colors.NC} {text}")
+    print(_PREFIX_STEP, text, sep='')
 
 def check_python_version() -> Tuple[bool, str]:
     """Check if Python version is compatible."""
@@ -58,6 +126,8 @@ def check_python_version() -> Tuple[bool, str]:
 
 def check_required_packages() -> Dict[str, bool]:
     """Check if required Python packages are installed."""
+    from importlib.metadata import distributions
+
     required_packages = [
         'pygls',
         'lsprotocol',
@@ -68,16 +138,30 @@ def check_required_packages() -> Dict[str, bool]:
         'regex'
     ]
 
+    # Distribution names for packages whose import name differs
+    distribution_names = {'bs4': 'beautifulsoup4'}
+
+    # One pass over installed distributions instead of a finder lookup per package
+    installed = set()
+    for dist in distributions():
+        name = dist.metadata['Name']
+        if name:
+            installed.add(name.lower().replace('-', '_'))
+
     results = {}
     for package in required_packages:
-        try:
-            importlib.import_module(package)
-            results[package] = True
-        except ImportError:
-            results[package] = False
+        results[package] = distribution_names.get(package, package) in installed
 
     return results
 
+def list_directory(directory: Path) -> Set[str]:
+    """List entry names in a directory with a single scandir call."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name for entry in entries}
+    except OSError:
+        return set()
+
 def check_extension_files() -> Dict[str, bool]:
     """Check if all required extension files exist."""
     base_path = Path(__file__).parent
@@ -89,36 +173,75 @@ def check_extension_files() -> Dict[str, bool]:
         'completion provider': base_path / 'server' / 'completion_provider.py',
         'emmet support': base_path / 'server' / 'emmet_support.py',
         'requirements.txt': base_path / 'server' / 'requirements.txt',
-        'setup.py': base_path / 'server' / 'setup.py'
+        'pyproject.toml': base_path / 'server' / 'pyproject.toml'
     }
 
+    # One directory listing per parent instead of one stat per file
+    listings = {}
     results = {}
     for name, path in required_files.items():
-        results[name] = path.exists()
+        if path.parent not in listings:
+            listings[path.parent] = list_directory(path.parent)
+        results[name] = path.name in listings[path.parent]
 
     return results
 
+def scan_manifest_text(content: str) -> Tuple[bool, List[str]]:
+    """Check the manifest by key substrings, for when no TOML parser is available."""
+    issues = []
+    required_keys = ['id', 'name', 'description', 'version', 'schema_version']
+
+    for key in required_keys:
+        if f'{key} = ' not in content:
+            issues.append(f"Missing required field: {key}")
+
+    if 'language_servers.jinja2_html_lsp' not in content:
+        issues.append("Missing language server configuration")
+
+    return len(issues) == 0, issues
+
 def validate_extension_manifest() -> Tuple[bool, List[str]]:
     """Validate the extension manifest file."""
+    try:
+        import tomllib
+    except ImportError:
+        # Python < 3.11; tomli is optional there, so without it the
+        # manifest is only scanned for its keys
+        try:
+            import tomli as tomllib
+        except ImportError:
+            tomllib = None
+
     base_path = Path(__file__).parent
     manifest_path = base_path / 'extension.toml'
 
-    if not manifest_path.exists():
+    try:
+        manifest_size = manifest_path.stat().st_size
+    except FileNotFoundError:
         return False, ["extension.toml not found"]
 
+    if manifest_size > MAX_CONFIG_FILE_SIZE:
+        return False, [f"extension.toml is too large ({manifest_size} bytes)"]
+
+    if tomllib is None:
+        try:
+            with open(manifest_path, 'r') as f:
+                return scan_manifest_text(f.read())
+        except Exception as e:
+            return False, [f"Error reading manifest: {str(e)}"]
+
     try:
-        # Basic validation - check if file can be read
-        with open(manifest_path, 'r') as f:
-            content = f.read()
+        with open(manifest_path, 'rb') as f:
+            manifest = tomllib.load(f)
 
         issues = []
         required_keys = ['id', 'name', 'description', 'version', 'schema_version']
 
         for key in required_keys:
-            if f'{key} = ' not in content:
+            if key not in manifest:
                 issues.append(f"Missing required field: {key}")
 
-        if 'language_servers.jinja2_html_lsp' not in content:
+        if 'jinja2_html_lsp' not in manifest.get('language_servers', {}):
             issues.append("Missing language server configuration")
 
         # Language configuration is in a separate file for this project structure
@@ -126,17 +249,26 @@ def validate_extension_manifest() -> Tuple[bool, List[str]]:
 
         return len(issues) == 0, issues
 
+    except tomllib.TOMLDecodeError as e:
+        return False, [f"Invalid TOML: {str(e)}"]
     except Exception as e:
         return False, [f"Error reading manifest: {str(e)}"]
 
 def validate_grammar_file() -> Tuple[bool, List[str]]:
     """Validate the TextMate grammar file."""
+    import json
+
     base_path = Path(__file__).parent
     grammar_path = base_path / 'grammars' / 'jinja2_html' / 'grammar.json'
 
-    if not grammar_path.exists():
+    try:
+        grammar_size = grammar_path.stat().st_size
+    except FileNotFoundError:
         return False, ["grammar.json not found"]
 
+    if grammar_size > MAX_CONFIG_FILE_SIZE:
+        return False, [f"grammar.json is too large ({grammar_size} bytes)"]
+
     try:
         with open(grammar_path, 'r') as f:
             grammar = json.load(f)
@@ -161,19 +293,49 @@ def validate_grammar_file() -> Tuple[bool, List[str]]:
     except Exception as e:
         return False, [f"Error reading grammar: {str(e)}"]
 
-def test_language_server() -> Tuple[bool, List[str]]:
-    """Test if the language server can be imported and initialized."""
+@functools.lru_cache(maxsize=None)
+def _load_server_modules():
+    """Import the language server components once and cache them."""
+    import importlib
+    import importlib.util
+
     base_path = Path(__file__).parent
     server_path = base_path / 'server'
 
-    # Add server directory to Python path
-    sys.path.insert(0, str(server_path))
-
+    # Load server/ as a package from its location instead of mutating sys.path
+    spec = importlib.util.spec_from_file_location(
+        SERVER_PACKAGE,
+        server_path / '__init__.py',
+        submodule_search_locations=[str(server_path)]
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules[SERVER_PACKAGE] = package
+    try:
+        spec.loader.exec_module(package)
+    except BaseException:
+        del sys.modules[SERVER_PACKAGE]
+        raise
+
+    main_module = importlib.import_module(f'{SERVER_PACKAGE}.main')
+    completion_module = importlib.import_module(f'{SERVER_PACKAGE}.completion_provider')
+    emmet_module = importlib.import_module(f'{SERVER_PACKAGE}.emmet_support')
+
+    return (
+        main_module.Jinja2HTMLLanguageServer,
+        completion_module.Jinja2HTMLCompletionProvider,
+        emmet_module.EmmetExpander,
+        emmet_module.emmet_integration
+    )
+
+def test_language_server() -> Tuple[bool, List[str], Optional[Any]]:
+    """Test if the language server can be imported and initialized.
+
+    Also returns the completion provider built along the way so later
+    checks can reuse it.
+    """
     try:
         # Test imports
-        from main import Jinja2HTMLLanguageServer
-        from completion_provider import Jinja2HTMLCompletionProvider
-        from emmet_support import EmmetExpander, JinjaEmmetIntegration
+        Jinja2HTMLLanguageServer, Jinja2HTMLCompletionProvider, EmmetExpander, _ = _load_server_modules()
 
         # Test basic initialization
         server = Jinja2HTMLLanguageServer()
@@ -198,24 +360,64 @@ def test_language_server() -> Tuple[bool, List[str]]:
         if not emmet_result:
             issues.append("Emmet expansion failed")
 
-        return len(issues) == 0, issues
+        return len(issues) == 0, issues, provider
 
     except ImportError as e:
-        return False, [f"Import error: {str(e)}"]
+        return False, [f"Import error: {str(e)}"], None
     except Exception as e:
-        return False, [f"Runtime error: {str(e)}"]
-    finally:
-        # Remove server path from Python path
-        if str(server_path) in sys.path:
-            sys.path.remove(str(server_path))
+        return False, [f"Runtime error: {str(e)}"], None
+
+def _read_zed_version_cache(zed_path: str, mtime: float) -> Optional[str]:
+    """Return the cached Zed version if it matches the executable."""
+    import json
+
+    try:
+        cached = json.loads(ZED_VERSION_CACHE.read_text())
+    except (OSError, ValueError):
+        return None
+
+    if isinstance(cached, dict) and cached.get('path') == zed_path and cached.get('mtime') == mtime:
+        return cached.get('version')
+    return None
+
+def _write_zed_version_cache(zed_path: str, mtime: float, version: str):
+    """Store the Zed version for the given executable."""
+    import json
+
+    try:
+        ZED_VERSION_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        ZED_VERSION_CACHE.write_text(json.dumps({'path': zed_path, 'mtime': mtime, 'version': version}))
+    except OSError:
+        pass  # Caching is best-effort
 
 def check_zed_installation() -> Tuple[bool, str]:
     """Check if Zed IDE is installed."""
+    import shutil
+    import subprocess
+
+    # Locate the executable without spawning a process
+    zed_path = shutil.which('zed')
+    if zed_path is None:
+        return False, "Zed command not found"
+
     try:
-        result = subprocess.run(['zed', '--version'],
+        mtime = os.stat(zed_path).st_mtime
+    except OSError:
+        mtime = None
+
+    if mtime is not None:
+        cached_version = _read_zed_version_cache(zed_path, mtime)
+        if cached_version:
+            return True, cached_version
+
+    try:
+        result = subprocess.run([zed_path, '--version'],
                               capture_output=True, text=True, timeout=5)
         if result.returncode == 0:
-            return True, result.stdout.strip()
+            version = result.stdout.strip()
+            if mtime is not None:
+                _write_zed_version_cache(zed_path, mtime, version)
+            return True, version
         else:
             return False, "Zed command failed"
     except subprocess.TimeoutExpired:
@@ -227,14 +429,7 @@ def check_zed_installation() -> Tuple[bool, str]:
 
 def get_zed_extensions_dir() -> Optional[Path]:
     """Get the Zed extensions directory path."""
-    if sys.platform == "darwin":  # macOS
-        return Path.home() / ".config" / "zed" / "extensions"
-    elif sys.platform.startswith("linux"):  # Linux
-        return Path.home() / ".config" / "zed" / "extensions"
-    elif sys.platform.startswith("win"):  # Windows
-        return Path(os.environ.get('APPDATA', '')) / "Zed" / "extensions"
-    else:
-        return Path.home() / ".config" / "zed" / "extensions"
+    return ZED_EXTENSIONS_DIR
 
 def check_extension_installation() -> Tuple[bool, str]:
     """Check if the extension is installed in Zed."""
@@ -251,8 +446,12 @@ def check_extension_installation() -> Tuple[bool, str]:
     required_files = ['extension.toml', 'server/main.py']
     missing_files = []
 
+    listings = {}
     for file_name in required_files:
-        if not (extension_dir / file_name).exists():
+        path = extension_dir / file_name
+        if path.parent not in listings:
+            listings[path.parent] = list_directory(path.parent)
+        if path.name not in listings[path.parent]:
             missing_files.append(file_name)
 
     if missing_files:
@@ -262,45 +461,15 @@ def check_extension_installation() -> Tuple[bool, str]:
 
 def generate_sample_config() -> str:
     """Generate a sample Zed configuration."""
-    config = {
-        "languages": {
-            "Jinja2 HTML": {
-                "language_servers": ["jinja2-html-lsp"],
-                "format_on_save": "on",
-                "tab_size": 2,
-                "hard_tabs": False
-            }
-        },
-        "lsp": {
-            "jinja2-html-lsp": {
-                "binary": {
-                    "path": "python",
-                    "arguments": ["-m", "server.main"]
-                },
-                "settings": {
-                    "jinja2": {
-                        "enable_emmet": True,
-                        "enable_jinja_snippets": True,
-                        "auto_close_tags": True
-                    }
-                }
-            }
-        }
-    }
-
-    return json.dumps(config, indent=2)
+    return SAMPLE_ZED_CONFIG
 
-def run_comprehensive_test() -> Tuple[bool, List[str]]:
+def run_comprehensive_test(provider: Optional[Any] = None) -> Tuple[bool, List[str]]:
     """Run a comprehensive functionality test."""
-    base_path = Path(__file__).parent
-    server_path = base_path / 'server'
-    sys.path.insert(0, str(server_path))
-
     try:
-        from completion_provider import Jinja2HTMLCompletionProvider
-        from emmet_support import emmet_integration
+        _, Jinja2HTMLCompletionProvider, _, emmet_integration = _load_server_modules()
 
-        provider = Jinja2HTMLCompletionProvider()
+        if provider is None:
+            provider = Jinja2HTMLCompletionProvider()
         issues = []
 
         # Test HTML completion
@@ -335,14 +504,22 @@ def run_comprehensive_test() -> Tuple[bool, List[str]]:
 
     except Exception as e:
         return False, [f"Test error: {str(e)}"]
-    finally:
-        if str(server_path) in sys.path:
-            sys.path.remove(str(server_path))
 
 def main():
     """Run all diagnostic checks."""
+    from concurrent.futures import ThreadPoolExecutor
+
     print_header("Jinja2 HTML Language Server Diagnostics")
 
+    # Independent I/O-bound checks run in the background; their results are
+    # reported in order below
+    executor = ThreadPoolExecutor(max_workers=4)
+    manifest_future = executor.submit(validate_extension_manifest)
+    grammar_future = executor.submit(validate_grammar_file)
+    zed_future = executor.submit(check_zed_installation)
+    ext_future = executor.submit(check_extension_installation)
+    executor.shutdown(wait=False)
+
     # Python version check
     print_step("Checking Python version...")
     py_ok, py_version = check_python_version()
@@ -374,7 +551,7 @@ def main():
 
     # Extension manifest validation
     print_step("Validating extension manifest...")
-    manifest_ok, manifest_issues = validate_extension_manifest()
+    manifest_ok, manifest_issues = manifest_future.result()
     if manifest_ok:
         print_success("Extension manifest is valid")
     else:
@@ -384,7 +561,7 @@ def main():
 
     # Grammar file validation
     print_step("Validating grammar file...")
-    grammar_ok, grammar_issues = validate_grammar_file()
+    grammar_ok, grammar_issues = grammar_future.result()
     if grammar_ok:
         print_success("Grammar file is valid")
     else:
@@ -395,7 +572,7 @@ def main():
     # Language server test
     print_step("Testing language server...")
     if not missing_packages:  # Only test if packages are available
-        server_ok, server_issues = test_language_server()
+        server_ok, server_issues, provider = test_language_server()
         if server_ok:
             print_success("Language server components working")
         else:
@@ -405,10 +582,11 @@ def main():
     else:
         print_warning("Skipping language server test (missing packages)")
         server_ok = False
+        provider = None
 
     # Zed installation check
     print_step("Checking Zed IDE installation...")
-    zed_ok, zed_info = check_zed_installation()
+    zed_ok, zed_info = zed_future.result()
     if zed_ok:
         print_success(f"Zed IDE found: {zed_info}")
     else:
@@ -416,7 +594,7 @@ def main():
 
     # Extension installation check
     print_step("Checking extension installation...")
-    ext_ok, ext_info = check_extension_installation()
+    ext_ok, ext_info = ext_future.result()
     if ext_ok:
         print_success(f"Extension installed: {ext_info}")
     else:
@@ -425,7 +603,7 @@ def main():
     # Comprehensive functionality test
     if not missing_packages and manifest_ok and grammar_ok:
         print_step("Running comprehensive functionality test...")
-        test_ok, test_issues = run_comprehensive_test()
+        test_ok, test_issues = run_comprehensive_test(provider)
         if test_ok:
             print_success("All functionality tests passed")
         else:
@@ -436,66 +614,72 @@ def main():
         print_warning("Skipping functionality test (prerequisites not met)")
         test_ok = False
 
-    # Summary
-    print_header("Diagnostic Summary")
-
-    all_checks = [
-        ("Python Version", py_ok),
-        ("Required Packages", not missing_packages),
-        ("Extension Files", not missing_files),
-        ("Extension Manifest", manifest_ok),
-        ("Grammar File", grammar_ok),
-        ("Language Server", server_ok if not missing_packages else None),
-        ("Zed IDE", zed_ok),
-        ("Extension Installation", ext_ok),
-        ("Functionality Test", test_ok if not missing_packages else None)
-    ]
+    # Buffer the report sections and write them with a single call
+    report = io.StringIO()
+    with contextlib.redirect_stdout(report):
+        # Summary
+        print_header("Diagnostic Summary")
+
+        all_checks = [
+            ("Python Version", py_ok),
+            ("Required Packages", not missing_packages),
+            ("Extension Files", not missing_files),
+            ("Extension Manifest", manifest_ok),
+            ("Grammar File", grammar_ok),
+            ("Language Server", server_ok if not missing_packages else None),
+            ("Zed IDE", zed_ok),
+            ("Extension Installation", ext_ok),
+            ("Functionality Test", test_ok if not missing_packages else None)
+        ]
+
+        for check_name, status in all_checks:
+            if status is True:
+                print_success(check_name)
+            elif status is False:
+                print_error(check_name)
+            else:
+                print_warning(f"{check_name} (skipped)")
+
+        # Recommendations
+        print_header("Recommendations")
+
+        if not py_ok:
+            print_info("1. Upgrade to Python 3.8 or later")
+
+        if missing_packages:
+            print_info("2. Install missing packages:")
+            print(f"   pip install {' '.join(missing_packages)}")
+
+        if missing_files:
+            print_info("3. Ensure all extension files are present")
 
-    for check_name, status in all_checks:
-        if status is True:
-            print_success(check_name)
-        elif status is False:
-            print_error(check_name)
+        if not ext_ok:
+            print_info("4. Install the extension:")
+            print("   Run: ./install.sh")
+
+        if not zed_ok:
+            print_info("5. Install Zed IDE from https://zed.dev/")
+
+        # Generate sample config
+        print_header("Sample Zed Configuration")
+        print("Add this to your Zed settings.json:")
+        print()
+        print(generate_sample_config())
+
+        # Final status
+        all_critical_ok = py_ok and not missing_packages and not missing_files and manifest_ok and grammar_ok
+
+        print()
+        if all_critical_ok:
+            print_success("✓ Extension is ready for use!")
+            if not ext_ok:
+                print_info("Run './install.sh' to install in Zed")
         else:
-            print_warning(f"{check_name} (skipped)")
-
-    # Recommendations
-    print_header("Recommendations")
-
-    if not py_ok:
-        print_info("1. Upgrade to Python 3.8 or later")
-
-    if missing_packages:
-        print_info("2. Install missing packages:")
-        print(f"   pip install {' '.join(missing_packages)}")
+            print_error("✗ Extension has issues that need to be resolved")
+            print_info("Fix the issues above and run diagnostics again")
 
-    if missing_files:
-        print_info("3. Ensure all extension files are present")
-
-    if not ext_ok:
-        print_info("4. Install the extension:")
-        print("   Run: ./install.sh")
-
-    if not zed_ok:
-        print_info("5. Install Zed IDE from https://zed.dev/")
-
-    # Generate sample config
-    print_header("Sample Zed Configuration")
-    print("Add this to your Zed settings.json:")
-    print()
-    print(generate_sample_config())
-
-    # Final status
-    all_critical_ok = py_ok and not missing_packages and not missing_files and manifest_ok and grammar_ok
-
-    print()
-    if all_critical_ok:
-        print_success("✓ Extension is ready for use!")
-        if not ext_ok:
-            print_info("Run './install.sh' to install in Zed")
-    else:
-        print_error("✗ Extension has issues that need to be resolved")
-        print_info("Fix the issues above and run diagnostics again")
+    sys.stdout.write(report.getvalue())
+    sys.stdout.flush()
 
     return 0 if all_critical_ok else 1
 
@@ -5,7 +5,14 @@ Provides intelligent auto-completion for HTML, Jinja2, and integrated features.
 """
 
 import re
-from typing import List, Dict, Optional, Set, Tuple, Any
+import sys
+import bisect
+import functools
+import heapq
+import itertools
+from collections import Counter
+from types import MappingProxyType
+from typing import List, Dict, Iterator, Mapping, Optional, Set, Tuple, Any
 from dataclasses import dataclass
 from enum import Enum
 import json
@@ -25,6 +32,26 @@ except ImportError:
     from emmet_support import emmet_integration
 
 
+# Context detection patterns, compiled once at import. They are matched with
+# search(line, 0, position) so `$` anchors at the cursor without slicing.
+_TAG_RE = re.compile(r'<(\w+)[^>]*$')
+# A single \w before the '=' is enough to know an attribute value is open,
+# and it spares the engine from retrying \w+ at every letter of each word
+_ATTR_VALUE_RE = re.compile(r'\w\s*=\s*["\'][^"\']*$')
+_ATTR_NAME_RE = re.compile(r'<\w+[^>]*\s+[\w-]*$')
+_CSS_CLASS_RE = re.compile(r'class\s*=\s*["\'][^"\']*$')
+_CSS_ID_RE = re.compile(r'id\s*=\s*["\'][^"\']*$')
+
+# The only characters that change quote state: quotes, and backslash
+# escapes, which are matched together with the character they hide
+_QUOTE_TOKEN_RE = re.compile(r'\\.|["\']', re.DOTALL)
+
+# Characters that make up a completion word; \w covers the same characters
+# as str.isalnum() plus '_'
+_WORD_END_RE = re.compile(r'[\w\-.:]*')
+_WORD_CHARS = frozenset('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-.:')
+
+
 class CompletionContext(Enum):
     """Context types for completion."""
     HTML = "html"
@@ -38,7 +65,51 @@ class CompletionContext(Enum):
     UNKNOWN = "unknown"
 
 
-@dataclass
+# Name of the attribute whose value is being typed
+_ATTR_CTX_RE = re.compile(r'(\w+)\s*=\s*["\'][^"\']*$')
+
+# class="..." and id="..." attribute values in template source
+_CLASS_ATTR_RE = re.compile(r'class\s*=\s*["\']([^"\']+)["\']')
+_ID_ATTR_RE = re.compile(r'id\s*=\s*["\']([^"\']+)["\']')
+
+# A class or id attribute whose value is still open at the end of the text
+_OPEN_ATTR_VALUE_RE = re.compile(r'(?:class|id)\s*=\s*(?:["\'][^"\']*)?\Z')
+
+# Every name the completions pull from a document, found in one scan:
+# variables referenced in {{ }}, bound by {% for %} and assigned by
+# {% set %}, plus class and id attribute values. Each alternative sits in a
+# lookahead so a match of one kind never hides a match of another, e.g.
+# the {{ }} inside class="{{ cls }}". The leading (?=[{ci]) rejects every
+# position that can't start one of them before any alternative is tried.
+_DOCUMENT_NAMES_RE = re.compile(
+    r'(?=[{ci])(?:'
+    r'(?=(?P<expr>\{\{\s*(?P<expr_name>[a-zA-Z_][a-zA-Z0-9_]*(?:\.[a-zA-Z_][a-zA-Z0-9_]*)*)))'
+    r'|(?=(?P<for>\{%\s*for\s+(?P<for_name>[a-zA-Z_][a-zA-Z0-9_]*)))'
+    r'|(?=(?P<set>\{%\s*set\s+(?P<set_name>[a-zA-Z_][a-zA-Z0-9_]*)))'
+    r'|(?=(?P<cls>' + _CLASS_ATTR_RE.pattern.replace('(', '(?P<cls_name>', 1) + r'))'
+    r'|(?=(?P<id>' + _ID_ATTR_RE.pattern.replace('(', '(?P<id_name>', 1) + r'))'
+    r')'
+)
+
+# Most document classes or IDs offered per completion request
+_DOCUMENT_NAME_LIMIT = 50
+
+# All six Jinja2 delimiters in one pattern; the lookahead reports
+# overlapping matches so '{%}' yields both '{%' and '%}'
+_JINJA_DELIMITER_RE = re.compile(r'(?=(\{[{%#]|[}%#]\}))')
+_JINJA_DELIMITERS = {
+    '{{': (CompletionContext.JINJA_EXPRESSION, True),
+    '}}': (CompletionContext.JINJA_EXPRESSION, False),
+    '{%': (CompletionContext.JINJA_STATEMENT, True),
+    '%}': (CompletionContext.JINJA_STATEMENT, False),
+    '{#': (CompletionContext.JINJA_COMMENT, True),
+    '#}': (CompletionContext.JINJA_COMMENT, False),
+}
+
+
+# slots=True needs Python 3.10; the request stays mutable because callers
+# adjust fields such as word after analysis
+@dataclass(**({'slots': True} if sys.version_info >= (3, 10) else {}))
 class CompletionRequest:
     """Represents a completion request with context."""
     position: Position
@@ -51,486 +122,1012 @@ class CompletionRequest:
     tag_name: Optional[str] = None
 
 
-class Jinja2HTMLCompletionProvider:
-    """Comprehensive completion provider for Jinja2 HTML templates."""
+class _PrefixIndex:
+    """Sorted index over completion labels for prefix lookups.
+
+    Keys are stored verbatim, so lookups are case-sensitive; matches come back
+    in insertion order.
+    """
+
+    def __init__(self, items=()):
+        # Parallel lists sorted by key: the keys for bisect, and the
+        # (insertion index, key, value) entries they locate
+        self._keys: List[str] = []
+        self._entries: List[Tuple[int, str, Any]] = []
+        for key, value in items:
+            self.insert(key, value)
+
+    def insert(self, key: str, value: Any):
+        """Add a value under key."""
+        position = bisect.bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._entries.insert(position, (len(self._entries), key, value))
+
+    def items_with_prefix(self, prefix: str) -> List[Tuple[str, Any]]:
+        """Return (key, value) for every key that starts with prefix."""
+        return [(key, value) for _, key, value in self._entries_with_prefix(prefix)]
+
+    def values_with_prefix(self, prefix: str) -> Iterator[Any]:
+        """Yield the value of every key that starts with prefix."""
+        return (value for _, _, value in self._entries_with_prefix(prefix))
+
+    def _entries_with_prefix(self, prefix: str) -> List[Tuple[int, str, Any]]:
+        """Collect the entries under prefix in insertion order."""
+        # Keys starting with prefix form one contiguous run in sorted order;
+        # no label contains U+10FFFF, so prefix + that bounds the run
+        low = bisect.bisect_left(self._keys, prefix)
+        high = bisect.bisect_left(self._keys, prefix + '\U0010ffff', low)
+        found = self._entries[low:high]
+
+        # Insertion indexes are unique, so tuples never compare past them
+        found.sort()
+        return found
+
+
+class _RankedTrieNode:
+    """Node of a _RankedTrie."""
+    
+    __slots__ = ('children', 'rank', 'max_rank')
     
     def __init__(self):
-        self.html_tags = self._load_html_tags()
-        self.html_attributes = self._load_html_attributes()
-        self.jinja2_filters = self._load_jinja2_filters()
-        self.jinja2_functions = self._load_jinja2_functions()
-        self.jinja2_tests = self._load_jinja2_tests()
-        self.jinja2_keywords = self._load_jinja2_keywords()
-        self.css_properties = self._load_css_properties()
-        self.common_values = self._load_common_attribute_values()
-        
-        # Cache for extracted variables and context
-        self._variable_cache = {}
-        self._context_cache = {}
-    
-    def _load_html_tags(self) -> Dict[str, Dict[str, Any]]:
-        """Load HTML tags with metadata."""
-        return {
-            'div': {
-                'description': 'Generic container element',
-                'attributes': ['class', 'id', 'style', 'data-*'],
-                'snippet': '<div$1>$2</div>$0'
-            },
-            'span': {
-                'description': 'Inline generic container',
-                'attributes': ['class', 'id', 'style'],
-                'snippet': '<span$1>$2</span>$0'
-            },
-            'p': {
-                'description': 'Paragraph element',
-                'attributes': ['class', 'id', 'style'],
-                'snippet': '<p$1>$2</p>$0'
-            },
-            'a': {
-                'description': 'Anchor/link element',
-                'attributes': ['href', 'target', 'rel', 'class', 'id'],
-                'snippet': '<a href="$1"$2>$3</a>$0'
-            },
-            'img': {
-                'description': 'Image element',
-                'attributes': ['src', 'alt', 'width', 'height', 'class', 'id'],
-                'snippet': '<img src="$1" alt="$2"$3>$0',
-                'void': True
-            },
-            'input': {
-                'description': 'Input element',
-                'attributes': ['type', 'name', 'value', 'placeholder', 'required', 'class', 'id'],
-                'snippet': '<input type="$1" name="$2"$3>$0',
-                'void': True
-            },
-            'form': {
-                'description': 'Form element',
-                'attributes': ['action', 'method', 'enctype', 'class', 'id'],
-                'snippet': '<form action="$1" method="$2"$3>\n    $4\n</form>$0'
-            },
-            'button': {
-                'description': 'Button element',
-                'attributes': ['type', 'name', 'value', 'class', 'id', 'onclick'],
-                'snippet': '<button type="$1"$2>$3</button>$0'
-            },
-            'table': {
-                'description': 'Table element',
-                'attributes': ['class', 'id', 'border', 'cellpadding', 'cellspacing'],
-                'snippet': '<table$1>\n    <tr>\n        <td>$2</td>\n    </tr>\n</table>$0'
-            },
-            'ul': {
-                'description': 'Unordered list',
-                'attributes': ['class', 'id', 'style'],
-                'snippet': '<ul$1>\n    <li>$2</li>\n</ul>$0'
-            },
-            'ol': {
-                'description': 'Ordered list',
-                'attributes': ['class', 'id', 'style', 'type', 'start'],
-                'snippet': '<ol$1>\n    <li>$2</li>\n</ol>$0'
-            },
-            'li': {
-                'description': 'List item',
-                'attributes': ['class', 'id', 'style'],
-                'snippet': '<li$1>$2</li>$0'
-            },
-            'h1': {'description': 'Heading 1', 'snippet': '<h1$1>$2</h1>$0'},
-            'h2': {'description': 'Heading 2', 'snippet': '<h2$1>$2</h2>$0'},
-            'h3': {'description': 'Heading 3', 'snippet': '<h3$1>$2</h3>$0'},
-            'h4': {'description': 'Heading 4', 'snippet': '<h4$1>$2</h4>$0'},
-            'h5': {'description': 'Heading 5', 'snippet': '<h5$1>$2</h5>$0'},
-            'h6': {'description': 'Heading 6', 'snippet': '<h6$1>$2</h6>$0'},
-            'header': {
-                'description': 'Header section',
-                'snippet': '<header$1>\n    $2\n</header>$0'
-            },
-            'footer': {
-                'description': 'Footer section',
-                'snippet': '<footer$1>\n    $2\n</footer>$0'
-            },
-            'nav': {
-                'description': 'Navigation section',
-                'snippet': '<nav$1>\n    $2\n</nav>$0'
-            },
-            'main': {
-                'description': 'Main content section',
-                'snippet': '<main$1>\n    $2\n</main>$0'
-            },
-            'section': {
-                'description': 'Section element',
-                'snippet': '<section$1>\n    $2\n</section>$0'
-            },
-            'article': {
-                'description': 'Article element',
-                'snippet': '<article$1>\n    $2\n</article>$0'
-            },
-            'aside': {
-                'description': 'Aside element',
-                'snippet': '<aside$1>\n    $2\n</aside>$0'
-            }
-        }
+        self.children: Dict[str, '_RankedTrieNode'] = {}
+        self.rank = 0
+        self.max_rank = 0
+
+
+class _RankedTrie:
+    """Prefix trie of ranked names answering top-k prefix queries.
     
-    def _load_html_attributes(self) -> Dict[str, Dict[str, Any]]:
-        """Load HTML attributes with metadata."""
-        return {
-            'class': {
-                'description': 'Space-separated list of CSS classes',
-                'values': [],
-                'global': True
-            },
-            'id': {
-                'description': 'Unique identifier',
-                'global': True
-            },
-            'style': {
-                'description': 'Inline CSS styles',
-                'global': True
-            },
-            'title': {
-                'description': 'Advisory information about the element',
-                'global': True
-            },
-            'data-*': {
-                'description': 'Custom data attributes',
-                'global': True
-            },
-            'href': {
-                'description': 'URL reference',
-                'tags': ['a', 'link'],
-                'values': ['#', 'mailto:', 'tel:', 'javascript:']
-            },
-            'src': {
-                'description': 'Source URL',
-                'tags': ['img', 'script', 'iframe', 'audio', 'video', 'source'],
-            },
-            'alt': {
-                'description': 'Alternative text',
-                'tags': ['img', 'area', 'input']
-            },
-            'type': {
-                'description': 'Type specification',
-                'tags': ['input', 'button', 'script', 'style', 'link'],
-                'values': {
-                    'input': ['text', 'password', 'email', 'number', 'tel', 'url', 'search', 'submit', 'reset', 'button', 'checkbox', 'radio', 'file', 'hidden', 'date', 'datetime-local', 'month', 'week', 'time', 'color', 'range'],
-                    'button': ['submit', 'reset', 'button'],
-                    'script': ['text/javascript', 'module'],
-                    'style': ['text/css'],
-                    'link': ['stylesheet', 'icon', 'preload', 'prefetch']
-                }
-            },
-            'name': {
-                'description': 'Name of the element',
-                'tags': ['input', 'select', 'textarea', 'button', 'form', 'fieldset', 'output']
-            },
-            'value': {
-                'description': 'Value of the element',
-                'tags': ['input', 'button', 'option', 'li', 'meter', 'progress']
-            },
-            'placeholder': {
-                'description': 'Placeholder text',
-                'tags': ['input', 'textarea']
-            },
-            'required': {
-                'description': 'Required field',
-                'tags': ['input', 'select', 'textarea'],
-                'boolean': True
-            },
-            'disabled': {
-                'description': 'Disabled element',
-                'boolean': True
-            },
-            'readonly': {
-                'description': 'Read-only element',
-                'tags': ['input', 'textarea'],
-                'boolean': True
-            },
-            'checked': {
-                'description': 'Checked state',
-                'tags': ['input'],
-                'boolean': True
-            },
-            'selected': {
-                'description': 'Selected state',
-                'tags': ['option'],
-                'boolean': True
-            },
-            'method': {
-                'description': 'HTTP method',
-                'tags': ['form'],
-                'values': ['get', 'post', 'put', 'delete', 'patch']
-            },
-            'action': {
-                'description': 'Form action URL',
-                'tags': ['form']
-            },
-            'target': {
-                'description': 'Target window or frame',
-                'tags': ['a', 'form'],
-                'values': ['_blank', '_self', '_parent', '_top']
-            },
-            'rel': {
-                'description': 'Relationship between documents',
-                'tags': ['a', 'link'],
-                'values': ['stylesheet', 'icon', 'canonical', 'nofollow', 'noopener', 'noreferrer']
-            }
-        }
+    Every node records the best rank in its subtree, so a query expands
+    subtrees best first and never visits one that cannot make the top k.
+    """
     
-    def _load_jinja2_filters(self) -> Dict[str, Dict[str, Any]]:
-        """Load Jinja2 filters with metadata."""
-        return {
-            'abs': {'description': 'Return absolute value of a number'},
-            'attr': {'description': 'Get attribute of an object', 'args': ['name']},
-            'batch': {'description': 'Batch items into sublists', 'args': ['linecount', 'fill_with']},
-            'capitalize': {'description': 'Capitalize the first character'},
-            'center': {'description': 'Center string in given width', 'args': ['width']},
-            'default': {'description': 'Use default value if variable is undefined', 'args': ['default_value', 'boolean']},
-            'd': {'description': 'Alias for default filter', 'args': ['default_value', 'boolean']},
-            'dictsort': {'description': 'Sort dictionary by key or value', 'args': ['case_sensitive', 'by']},
-            'escape': {'description': 'Escape HTML characters'},
-            'e': {'description': 'Alias for escape filter'},
-            'filesizeformat': {'description': 'Format bytes as human readable file size'},
-            'first': {'description': 'Return first item of sequence'},
-            'float': {'description': 'Convert to floating point number', 'args': ['default']},
-            'forceescape': {'description': 'Force HTML escaping'},
-            'format': {'description': 'Format string using Python formatting'},
-            'groupby': {'description': 'Group items by attribute', 'args': ['attribute']},
-            'indent': {'description': 'Indent lines of text', 'args': ['width', 'first']},
-            'int': {'description': 'Convert to integer', 'args': ['default', 'base']},
-            'join': {'description': 'Join items with separator', 'args': ['separator', 'attribute']},
-            'last': {'description': 'Return last item of sequence'},
-            'length': {'description': 'Return length of sequence'},
-            'count': {'description': 'Alias for length filter'},
-            'list': {'description': 'Convert to list'},
-            'lower': {'description': 'Convert to lowercase'},
-            'map': {'description': 'Apply filter to each item', 'args': ['filter']},
-            'max': {'description': 'Return maximum value', 'args': ['attribute']},
-            'min': {'description': 'Return minimum value', 'args': ['attribute']},
-            'pprint': {'description': 'Pretty print variable'},
-            'random': {'description': 'Return random item from sequence'},
-            'reject': {'description': 'Filter items that match test', 'args': ['test']},
-            'rejectattr': {'description': 'Filter items by attribute test', 'args': ['attribute', 'test']},
-            'replace': {'description': 'Replace substring', 'args': ['old', 'new', 'count']},
-            'reverse': {'description': 'Reverse sequence'},
-            'round': {'description': 'Round number', 'args': ['precision', 'method']},
-            'safe': {'description': 'Mark string as safe for HTML output'},
-            's': {'description': 'Alias for safe filter'},
-            'select': {'description': 'Filter items that match test', 'args': ['test']},
-            'selectattr': {'description': 'Filter items by attribute test', 'args': ['attribute', 'test']},
-            'slice': {'description': 'Slice sequence', 'args': ['slices', 'fill_with']},
-            'sort': {'description': 'Sort sequence', 'args': ['reverse', 'case_sensitive', 'attribute']},
-            'string': {'description': 'Convert to string'},
-            'striptags': {'description': 'Remove HTML tags'},
-            'sum': {'description': 'Sum numeric values', 'args': ['attribute', 'start']},
-            'title': {'description': 'Convert to title case'},
-            'trim': {'description': 'Remove leading/trailing whitespace', 'args': ['chars']},
-            'truncate': {'description': 'Truncate string', 'args': ['length', 'killwords', 'end', 'leeway']},
-            'unique': {'description': 'Remove duplicate items', 'args': ['case_sensitive', 'attribute']},
-            'upper': {'description': 'Convert to uppercase'},
-            'urlencode': {'description': 'URL encode string'},
-            'urlize': {'description': 'Convert URLs to clickable links', 'args': ['trim_url_limit', 'nofollow', 'target', 'rel']},
-            'wordcount': {'description': 'Count words in string'},
-            'wordwrap': {'description': 'Wrap text to specified width', 'args': ['width', 'break_long_words', 'wrapstring']},
-            'xmlattr': {'description': 'Create XML/HTML attributes from dict'},
-            'tojson': {'description': 'Convert to JSON string', 'args': ['indent']},
-            'tojsonfilter': {'description': 'Alias for tojson filter'}
-        }
+    def __init__(self):
+        self._root = _RankedTrieNode()
     
-    def _load_jinja2_functions(self) -> Dict[str, Dict[str, Any]]:
-        """Load Jinja2 global functions."""
-        return {
-            'range': {'description': 'Generate range of numbers', 'args': ['start', 'stop', 'step']},
-            'lipsum': {'description': 'Generate lorem ipsum text', 'args': ['n', 'html', 'min', 'max']},
-            'dict': {'description': 'Create dictionary from keyword arguments'},
-            'cycler': {'description': 'Create cycler object', 'args': ['*items']},
-            'joiner': {'description': 'Create joiner object', 'args': ['sep']},
-            'namespace': {'description': 'Create namespace object for variable assignment'}
+    def set_rank(self, name: str, rank: int):
+        """Set the rank of a name; a rank of 0 removes it."""
+        node = self._root
+        path = [node]
+        for ch in name:
+            child = node.children.get(ch)
+            if child is None:
+                if rank <= 0:
+                    return
+                child = node.children[ch] = _RankedTrieNode()
+            node = child
+            path.append(node)
+        node.rank = max(rank, 0)
+        
+        # Refresh the subtree maxima bottom-up, dropping emptied branches
+        for depth in range(len(name), -1, -1):
+            node = path[depth]
+            node.max_rank = max([node.rank] + [child.max_rank for child in node.children.values()])
+            if depth and node.max_rank == 0:
+                del path[depth - 1].children[name[depth - 1]]
+    
+    def top_k(self, prefix: str, k: int) -> List[str]:
+        """Return up to k names starting with prefix, highest rank first."""
+        node = self._root
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        
+        # Heap entries are (-rank, name, is_subtree, node); a subtree is
+        # ordered by its best rank, and its name sorts before any name in it
+        results = []
+        heap = [(-node.max_rank, prefix, True, node)]
+        while heap and len(results) < k:
+            _, name, is_subtree, node = heapq.heappop(heap)
+            if not is_subtree:
+                results.append(name)
+                continue
+            if node.rank:
+                heapq.heappush(heap, (-node.rank, name, False, node))
+            for ch, child in node.children.items():
+                heapq.heappush(heap, (-child.max_rank, name + ch, True, child))
+        
+        return results
+
+
+class _DocumentIndex:
+    """CSS classes and IDs of one open document, maintained line by line.
+    
+    A class or id value that spans lines is scanned as one block, and its
+    names are recorded on the block's last line.
+    """
+    
+    def __init__(self):
+        self._lines: List[str] = []
+        self._line_names: List[Tuple[List[str], List[str]]] = []
+        
+        # Whether each line ends inside an attribute value continued below
+        self._line_open: List[bool] = []
+        self.classes: Counter = Counter()
+        self.ids: Counter = Counter()
+        
+        # Names ranked by occurrence count, for top-k prefix queries
+        self.class_trie = _RankedTrie()
+        self.id_trie = _RankedTrie()
+    
+    def update(self, source: str):
+        """Re-scan only the lines that differ from the previous source."""
+        old_lines = self._lines
+        new_lines = source.split('\n')
+        
+        # Skip the unchanged lines at both ends
+        start = 0
+        limit = min(len(old_lines), len(new_lines))
+        while start < limit and old_lines[start] == new_lines[start]:
+            start += 1
+        old_end, new_end = len(old_lines), len(new_lines)
+        while old_end > start and new_end > start and old_lines[old_end - 1] == new_lines[new_end - 1]:
+            old_end -= 1
+            new_end -= 1
+        
+        # Rescan from the start of the block holding the first changed line
+        old_open = self._line_open
+        while start > 0 and old_open[start - 1]:
+            start -= 1
+        
+        # Scan block by block until past the change, at a line where both the
+        # old and the new source start a block
+        scanned = []
+        opened = []
+        block = []
+        i = start
+        while i < len(new_lines):
+            if not block and i >= new_end:
+                old_i = old_end + i - new_end
+                if old_i == 0 or not old_open[old_i - 1]:
+                    break
+            line = new_lines[i]
+            i += 1
+            if not block and '=' not in line:
+                scanned.append(self._scan_line(line))
+                opened.append(False)
+                continue
+            block.append(line)
+            text = '\n'.join(block)
+            is_open = _OPEN_ATTR_VALUE_RE.search(text) is not None
+            opened.append(is_open)
+            # A block still open on the last line is scanned as it stands,
+            # and stays marked open in case lines are appended
+            if is_open and i < len(new_lines):
+                scanned.append(([], []))
+            else:
+                scanned.append(self._scan_line(text))
+                block = []
+        old_stop = old_end + i - new_end
+        
+        touched_classes = set()
+        touched_ids = set()
+        
+        for classes, ids in self._line_names[start:old_stop]:
+            self._discard(self.classes, classes)
+            self._discard(self.ids, ids)
+            touched_classes.update(classes)
+            touched_ids.update(ids)
+        
+        for classes, ids in scanned:
+            self.classes.update(classes)
+            self.ids.update(ids)
+            touched_classes.update(classes)
+            touched_ids.update(ids)
+        
+        for name in touched_classes:
+            self.class_trie.set_rank(name, self.classes[name])
+        for name in touched_ids:
+            self.id_trie.set_rank(name, self.ids[name])
+        
+        self._line_names[start:old_stop] = scanned
+        self._line_open[start:old_stop] = opened
+        self._lines = new_lines
+    
+    @staticmethod
+    def _scan_line(line: str) -> Tuple[List[str], List[str]]:
+        """Extract the CSS classes and IDs declared on one line or block."""
+        classes = [name for value in _CLASS_ATTR_RE.findall(line) for name in value.split()]
+        return classes, _ID_ATTR_RE.findall(line)
+    
+    @staticmethod
+    def _discard(counter: Counter, names: List[str]):
+        """Remove one occurrence of each name, dropping names that reach zero."""
+        for name in names:
+            counter[name] -= 1
+            if counter[name] <= 0:
+                del counter[name]
+
+
+# Call snippets by argument count: '()', '($1)', '($1, $2)', ...
+_ARGS_SNIPPET = tuple('(' + ', '.join(f'${i + 1}' for i in range(count)) + ')' for count in range(16))
+
+
+def _filter_prefix(names, prefix: str) -> List[str]:
+    """Return the names starting with prefix, choosing the comparison once per call."""
+    if not prefix:
+        return list(names)
+    if len(prefix) == 1:
+        # Most completions fire after the first typed character
+        return [name for name in names if name and name[0] == prefix]
+    return [name for name in names if name.startswith(prefix)]
+
+
+# Completion items for document names are never mutated after construction,
+# so one item per name is shared across requests
+@functools.lru_cache(maxsize=4096)
+def _variable_item(name: str) -> CompletionItem:
+    """Return the completion item for a template variable."""
+    return CompletionItem(
+        label=name,
+        kind=CompletionItemKind.Variable,
+        detail="Template variable",
+        documentation=f"Variable: {name}"
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _css_class_item(name: str) -> CompletionItem:
+    """Return the completion item for a CSS class used in a document."""
+    return CompletionItem(
+        label=name,
+        kind=CompletionItemKind.Value,
+        detail="CSS class",
+        insert_text=name
+    )
+
+
+@functools.lru_cache(maxsize=4096)
+def _css_id_item(name: str) -> CompletionItem:
+    """Return the completion item for an element ID used in a document."""
+    return CompletionItem(
+        label=name,
+        kind=CompletionItemKind.Value,
+        detail="CSS ID",
+        insert_text=name
+    )
+
+
+@functools.lru_cache(maxsize=1024)
+def _line_position(character: int) -> Position:
+    """Return the shared Position for a column of the analyzed line."""
+    return Position(line=0, character=character)
+
+
+def _interned(value):
+    """Intern every string in a nested table of dicts, lists and tuples."""
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, dict):
+        return {sys.intern(key): _interned(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_interned(item) for item in value)
+    return value
+
+
+def _heading_entry(level: int) -> Dict[str, str]:
+    """Build the tag table entry for <h1> to <h6>."""
+    return {'description': f'Heading {level}', 'snippet': f'<h{level}$1>$2</h{level}>$0'}
+
+
+# HTML tags with metadata
+_HTML_TAGS: Mapping[str, Mapping[str, Any]] = MappingProxyType(_interned({
+    'div': {
+        'description': 'Generic container element',
+        'attributes': ['class', 'id', 'style', 'data-*'],
+        'snippet': '<div$1>$2</div>$0'
+    },
+    'span': {
+        'description': 'Inline generic container',
+        'attributes': ['class', 'id', 'style'],
+        'snippet': '<span$1>$2</span>$0'
+    },
+    'p': {
+        'description': 'Paragraph element',
+        'attributes': ['class', 'id', 'style'],
+        'snippet': '<p$1>$2</p>$0'
+    },
+    'a': {
+        'description': 'Anchor/link element',
+        'attributes': ['href', 'target', 'rel', 'class', 'id'],
+        'snippet': '<a href="$1"$2>$3</a>$0'
+    },
+    'img': {
+        'description': 'Image element',
+        'attributes': ['src', 'alt', 'width', 'height', 'class', 'id'],
+        'snippet': '<img src="$1" alt="$2"$3>$0',
+        'void': True
+    },
+    'input': {
+        'description': 'Input element',
+        'attributes': ['type', 'name', 'value', 'placeholder', 'required', 'class', 'id'],
+        'snippet': '<input type="$1" name="$2"$3>$0',
+        'void': True
+    },
+    'form': {
+        'description': 'Form element',
+        'attributes': ['action', 'method', 'enctype', 'class', 'id'],
+        'snippet': '<form action="$1" method="$2"$3>\n    $4\n</form>$0'
+    },
+    'button': {
+        'description': 'Button element',
+        'attributes': ['type', 'name', 'value', 'class', 'id', 'onclick'],
+        'snippet': '<button type="$1"$2>$3</button>$0'
+    },
+    'table': {
+        'description': 'Table element',
+        'attributes': ['class', 'id', 'border', 'cellpadding', 'cellspacing'],
+        'snippet': '<table$1>\n    <tr>\n        <td>$2</td>\n    </tr>\n</table>$0'
+    },
+    'ul': {
+        'description': 'Unordered list',
+        'attributes': ['class', 'id', 'style'],
+        'snippet': '<ul$1>\n    <li>$2</li>\n</ul>$0'
+    },
+    'ol': {
+        'description': 'Ordered list',
+        'attributes': ['class', 'id', 'style', 'type', 'start'],
+        'snippet': '<ol$1>\n    <li>$2</li>\n</ol>$0'
+    },
+    'li': {
+        'description': 'List item',
+        'attributes': ['class', 'id', 'style'],
+        'snippet': '<li$1>$2</li>$0'
+    },
+    **{f'h{level}': _heading_entry(level) for level in range(1, 7)},
+    'header': {
+        'description': 'Header section',
+        'snippet': '<header$1>\n    $2\n</header>$0'
+    },
+    'footer': {
+        'description': 'Footer section',
+        'snippet': '<footer$1>\n    $2\n</footer>$0'
+    },
+    'nav': {
+        'description': 'Navigation section',
+        'snippet': '<nav$1>\n    $2\n</nav>$0'
+    },
+    'main': {
+        'description': 'Main content section',
+        'snippet': '<main$1>\n    $2\n</main>$0'
+    },
+    'section': {
+        'description': 'Section element',
+        'snippet': '<section$1>\n    $2\n</section>$0'
+    },
+    'article': {
+        'description': 'Article element',
+        'snippet': '<article$1>\n    $2\n</article>$0'
+    },
+    'aside': {
+        'description': 'Aside element',
+        'snippet': '<aside$1>\n    $2\n</aside>$0'
+    }
+}))
+
+
+# HTML attributes with metadata
+_HTML_ATTRIBUTES: Mapping[str, Mapping[str, Any]] = MappingProxyType(_interned({
+    'class': {
+        'description': 'Space-separated list of CSS classes',
+        'values': [],
+        'global': True
+    },
+    'id': {
+        'description': 'Unique identifier',
+        'global': True
+    },
+    'style': {
+        'description': 'Inline CSS styles',
+        'global': True
+    },
+    'title': {
+        'description': 'Advisory information about the element',
+        'global': True
+    },
+    'data-*': {
+        'description': 'Custom data attributes',
+        'global': True
+    },
+    'href': {
+        'description': 'URL reference',
+        'tags': ['a', 'link'],
+        'values': ['#', 'mailto:', 'tel:', 'javascript:']
+    },
+    'src': {
+        'description': 'Source URL',
+        'tags': ['img', 'script', 'iframe', 'audio', 'video', 'source'],
+    },
+    'alt': {
+        'description': 'Alternative text',
+        'tags': ['img', 'area', 'input']
+    },
+    'type': {
+        'description': 'Type specification',
+        'tags': ['input', 'button', 'script', 'style', 'link'],
+        'values': {
+            'input': ['text', 'password', 'email', 'number', 'tel', 'url', 'search', 'submit', 'reset', 'button', 'checkbox', 'radio', 'file', 'hidden', 'date', 'datetime-local', 'month', 'week', 'time', 'color', 'range'],
+            'button': ['submit', 'reset', 'button'],
+            'script': ['text/javascript', 'module'],
+            'style': ['text/css'],
+            'link': ['stylesheet', 'icon', 'preload', 'prefetch']
         }
+    },
+    'name': {
+        'description': 'Name of the element',
+        'tags': ['input', 'select', 'textarea', 'button', 'form', 'fieldset', 'output']
+    },
+    'value': {
+        'description': 'Value of the element',
+        'tags': ['input', 'button', 'option', 'li', 'meter', 'progress']
+    },
+    'placeholder': {
+        'description': 'Placeholder text',
+        'tags': ['input', 'textarea']
+    },
+    'required': {
+        'description': 'Required field',
+        'tags': ['input', 'select', 'textarea'],
+        'boolean': True
+    },
+    'disabled': {
+        'description': 'Disabled element',
+        'boolean': True
+    },
+    'readonly': {
+        'description': 'Read-only element',
+        'tags': ['input', 'textarea'],
+        'boolean': True
+    },
+    'checked': {
+        'description': 'Checked state',
+        'tags': ['input'],
+        'boolean': True
+    },
+    'selected': {
+        'description': 'Selected state',
+        'tags': ['option'],
+        'boolean': True
+    },
+    'method': {
+        'description': 'HTTP method',
+        'tags': ['form'],
+        'values': ['get', 'post', 'put', 'delete', 'patch']
+    },
+    'action': {
+        'description': 'Form action URL',
+        'tags': ['form']
+    },
+    'target': {
+        'description': 'Target window or frame',
+        'tags': ['a', 'form'],
+        'values': ['_blank', '_self', '_parent', '_top']
+    },
+    'rel': {
+        'description': 'Relationship between documents',
+        'tags': ['a', 'link'],
+        'values': ['stylesheet', 'icon', 'canonical', 'nofollow', 'noopener', 'noreferrer']
+    }
+}))
+
+
+# Jinja2 filters with metadata
+_JINJA2_FILTERS: Mapping[str, Mapping[str, Any]] = MappingProxyType(_interned({
+    'abs': {'description': 'Return absolute value of a number'},
+    'attr': {'description': 'Get attribute of an object', 'args': ['name']},
+    'batch': {'description': 'Batch items into sublists', 'args': ['linecount', 'fill_with']},
+    'capitalize': {'description': 'Capitalize the first character'},
+    'center': {'description': 'Center string in given width', 'args': ['width']},
+    'default': {'description': 'Use default value if variable is undefined', 'args': ['default_value', 'boolean']},
+    'd': {'description': 'Alias for default filter', 'args': ['default_value', 'boolean']},
+    'dictsort': {'description': 'Sort dictionary by key or value', 'args': ['case_sensitive', 'by']},
+    'escape': {'description': 'Escape HTML characters'},
+    'e': {'description': 'Alias for escape filter'},
+    'filesizeformat': {'description': 'Format bytes as human readable file size'},
+    'first': {'description': 'Return first item of sequence'},
+    'float': {'description': 'Convert to floating point number', 'args': ['default']},
+    'forceescape': {'description': 'Force HTML escaping'},
+    'format': {'description': 'Format string using Python formatting'},
+    'groupby': {'description': 'Group items by attribute', 'args': ['attribute']},
+    'indent': {'description': 'Indent lines of text', 'args': ['width', 'first']},
+    'int': {'description': 'Convert to integer', 'args': ['default', 'base']},
+    'join': {'description': 'Join items with separator', 'args': ['separator', 'attribute']},
+    'last': {'description': 'Return last item of sequence'},
+    'length': {'description': 'Return length of sequence'},
+    'count': {'description': 'Alias for length filter'},
+    'list': {'description': 'Convert to list'},
+    'lower': {'description': 'Convert to lowercase'},
+    'map': {'description': 'Apply filter to each item', 'args': ['filter']},
+    'max': {'description': 'Return maximum value', 'args': ['attribute']},
+    'min': {'description': 'Return minimum value', 'args': ['attribute']},
+    'pprint': {'description': 'Pretty print variable'},
+    'random': {'description': 'Return random item from sequence'},
+    'reject': {'description': 'Filter items that match test', 'args': ['test']},
+    'rejectattr': {'description': 'Filter items by attribute test', 'args': ['attribute', 'test']},
+    'replace': {'description': 'Replace substring', 'args': ['old', 'new', 'count']},
+    'reverse': {'description': 'Reverse sequence'},
+    'round': {'description': 'Round number', 'args': ['precision', 'method']},
+    'safe': {'description': 'Mark string as safe for HTML output'},
+    's': {'description': 'Alias for safe filter'},
+    'select': {'description': 'Filter items that match test', 'args': ['test']},
+    'selectattr': {'description': 'Filter items by attribute test', 'args': ['attribute', 'test']},
+    'slice': {'description': 'Slice sequence', 'args': ['slices', 'fill_with']},
+    'sort': {'description': 'Sort sequence', 'args': ['reverse', 'case_sensitive', 'attribute']},
+    'string': {'description': 'Convert to string'},
+    'striptags': {'description': 'Remove HTML tags'},
+    'sum': {'description': 'Sum numeric values', 'args': ['attribute', 'start']},
+    'title': {'description': 'Convert to title case'},
+    'trim': {'description': 'Remove leading/trailing whitespace', 'args': ['chars']},
+    'truncate': {'description': 'Truncate string', 'args': ['length', 'killwords', 'end', 'leeway']},
+    'unique': {'description': 'Remove duplicate items', 'args': ['case_sensitive', 'attribute']},
+    'upper': {'description': 'Convert to uppercase'},
+    'urlencode': {'description': 'URL encode string'},
+    'urlize': {'description': 'Convert URLs to clickable links', 'args': ['trim_url_limit', 'nofollow', 'target', 'rel']},
+    'wordcount': {'description': 'Count words in string'},
+    'wordwrap': {'description': 'Wrap text to specified width', 'args': ['width', 'break_long_words', 'wrapstring']},
+    'xmlattr': {'description': 'Create XML/HTML attributes from dict'},
+    'tojson': {'description': 'Convert to JSON string', 'args': ['indent']},
+    'tojsonfilter': {'description': 'Alias for tojson filter'}
+}))
+
+
+# Jinja2 global functions
+_JINJA2_FUNCTIONS: Mapping[str, Mapping[str, Any]] = MappingProxyType(_interned({
+    'range': {'description': 'Generate range of numbers', 'args': ['start', 'stop', 'step']},
+    'lipsum': {'description': 'Generate lorem ipsum text', 'args': ['n', 'html', 'min', 'max']},
+    'dict': {'description': 'Create dictionary from keyword arguments'},
+    'cycler': {'description': 'Create cycler object', 'args': ['*items']},
+    'joiner': {'description': 'Create joiner object', 'args': ['sep']},
+    'namespace': {'description': 'Create namespace object for variable assignment'}
+}))
+
+
+# Jinja2 test functions
+_JINJA2_TESTS: Mapping[str, Mapping[str, Any]] = MappingProxyType(_interned({
+    'callable': {'description': 'Test if object is callable'},
+    'defined': {'description': 'Test if variable is defined'},
+    'divisibleby': {'description': 'Test if number is divisible by another', 'args': ['num']},
+    'escaped': {'description': 'Test if string is escaped'},
+    'even': {'description': 'Test if number is even'},
+    'iterable': {'description': 'Test if object is iterable'},
+    'lower': {'description': 'Test if string is lowercase'},
+    'mapping': {'description': 'Test if object is mapping (dict-like)'},
+    'none': {'description': 'Test if value is None'},
+    'number': {'description': 'Test if value is a number'},
+    'odd': {'description': 'Test if number is odd'},
+    'sameas': {'description': 'Test if objects are the same', 'args': ['other']},
+    'sequence': {'description': 'Test if object is a sequence'},
+    'string': {'description': 'Test if value is a string'},
+    'undefined': {'description': 'Test if variable is undefined'},
+    'upper': {'description': 'Test if string is uppercase'}
+}))
+
+
+# Jinja2 keywords and statements
+_JINJA2_KEYWORDS: Mapping[str, Mapping[str, Any]] = MappingProxyType(_interned({
+    # Control structures
+    'if': {'description': 'Conditional statement', 'snippet': 'if $1:\n    $2\n{% endif %}$0'},
+    'elif': {'description': 'Else if condition'},
+    'else': {'description': 'Else clause'},
+    'endif': {'description': 'End if statement'},
+    'for': {'description': 'For loop', 'snippet': 'for $1 in $2:\n    $3\n{% endfor %}$0'},
+    'endfor': {'description': 'End for loop'},
+    'while': {'description': 'While loop (if supported)'},
+    'endwhile': {'description': 'End while loop'},
+    'break': {'description': 'Break from loop'},
+    'continue': {'description': 'Continue to next iteration'},
     
-    def _load_jinja2_tests(self) -> Dict[str, Dict[str, Any]]:
-        """Load Jinja2 test functions."""
-        return {
-            'callable': {'description': 'Test if object is callable'},
-            'defined': {'description': 'Test if variable is defined'},
-            'divisibleby': {'description': 'Test if number is divisible by another', 'args': ['num']},
-            'escaped': {'description': 'Test if string is escaped'},
-            'even': {'description': 'Test if number is even'},
-            'iterable': {'description': 'Test if object is iterable'},
-            'lower': {'description': 'Test if string is lowercase'},
-            'mapping': {'description': 'Test if object is mapping (dict-like)'},
-            'none': {'description': 'Test if value is None'},
-            'number': {'description': 'Test if value is a number'},
-            'odd': {'description': 'Test if number is odd'},
-            'sameas': {'description': 'Test if objects are the same', 'args': ['other']},
-            'sequence': {'description': 'Test if object is a sequence'},
-            'string': {'description': 'Test if value is a string'},
-            'undefined': {'description': 'Test if variable is undefined'},
-            'upper': {'description': 'Test if string is uppercase'}
+    # Template inheritance
+    'extends': {'description': 'Extend base template', 'snippet': 'extends "$1"'},
+    'block': {'description': 'Define block', 'snippet': 'block $1:\n    $2\n{% endblock %}$0'},
+    'endblock': {'description': 'End block definition'},
+    'super': {'description': 'Call parent block content'},
+    
+    # Include and import
+    'include': {'description': 'Include another template', 'snippet': 'include "$1"'},
+    'import': {'description': 'Import template', 'snippet': 'import "$1" as $2'},
+    'from': {'description': 'Import from template', 'snippet': 'from "$1" import $2'},
+    
+    # Variables and macros
+    'set': {'description': 'Set variable', 'snippet': 'set $1 = $2'},
+    'macro': {'description': 'Define macro', 'snippet': 'macro $1($2):\n    $3\n{% endmacro %}$0'},
+    'endmacro': {'description': 'End macro definition'},
+    'call': {'description': 'Call macro with content', 'snippet': 'call $1($2):\n    $3\n{% endcall %}$0'},
+    'endcall': {'description': 'End call block'},
+    
+    # Context and scoping
+    'with': {'description': 'Create local scope', 'snippet': 'with $1 = $2:\n    $3\n{% endwith %}$0'},
+    'endwith': {'description': 'End with block'},
+    'without': {'description': 'Without context modifier'},
+    'context': {'description': 'With context modifier'},
+    'ignore': {'description': 'Ignore missing'},
+    'missing': {'description': 'Missing template handling'},
+    
+    # Filters and processing
+    'filter': {'description': 'Apply filter to block', 'snippet': 'filter $1:\n    $2\n{% endfilter %}$0'},
+    'endfilter': {'description': 'End filter block'},
+    'raw': {'description': 'Raw content block', 'snippet': 'raw:\n    $1\n{% endraw %}$0'},
+    'endraw': {'description': 'End raw block'},
+    
+    # Auto-escaping
+    'autoescape': {'description': 'Auto-escape block', 'snippet': 'autoescape $1:\n    $2\n{% endautoescape %}$0'},
+    'endautoescape': {'description': 'End auto-escape block'},
+    
+    # Operators and logic
+    'and': {'description': 'Logical AND operator'},
+    'or': {'description': 'Logical OR operator'},
+    'not': {'description': 'Logical NOT operator'},
+    'is': {'description': 'Test operator'},
+    'in': {'description': 'Membership test operator'},
+    'as': {'description': 'Alias operator'},
+    
+    # Internationalization (if enabled)
+    'trans': {'description': 'Translation block', 'snippet': 'trans:\n    $1\n{% endtrans %}$0'},
+    'endtrans': {'description': 'End translation block'},
+    'pluralize': {'description': 'Pluralization in trans block'},
+    
+    # Miscellaneous
+    'do': {'description': 'Execute expression without output', 'snippet': 'do $1'}
+}))
+
+
+# Common CSS properties for style attribute completion
+_CSS_PROPERTIES: Tuple[str, ...] = _interned((
+    'color', 'background-color', 'font-size', 'font-family', 'font-weight',
+    'margin', 'margin-top', 'margin-right', 'margin-bottom', 'margin-left',
+    'padding', 'padding-top', 'padding-right', 'padding-bottom', 'padding-left',
+    'border', 'border-top', 'border-right', 'border-bottom', 'border-left',
+    'border-color', 'border-width', 'border-style', 'border-radius',
+    'width', 'height', 'max-width', 'max-height', 'min-width', 'min-height',
+    'display', 'position', 'top', 'right', 'bottom', 'left', 'z-index',
+    'float', 'clear', 'overflow', 'visibility', 'opacity',
+    'text-align', 'text-decoration', 'text-transform', 'line-height',
+    'vertical-align', 'white-space', 'word-wrap', 'word-break',
+    'flex', 'flex-direction', 'justify-content', 'align-items', 'align-content',
+    'grid', 'grid-template-columns', 'grid-template-rows', 'grid-gap',
+    'box-shadow', 'text-shadow', 'transform', 'transition', 'animation'
+))
+
+
+# Common values for HTML attributes
+_COMMON_ATTRIBUTE_VALUES: Mapping[str, List[str]] = MappingProxyType(_interned({
+    'display': ['block', 'inline', 'inline-block', 'flex', 'grid', 'none', 'table', 'table-cell'],
+    'position': ['static', 'relative', 'absolute', 'fixed', 'sticky'],
+    'text-align': ['left', 'center', 'right', 'justify'],
+    'font-weight': ['normal', 'bold', '100', '200', '300', '400', '500', '600', '700', '800', '900'],
+    'font-style': ['normal', 'italic', 'oblique'],
+    'text-decoration': ['none', 'underline', 'overline', 'line-through'],
+    'text-transform': ['none', 'uppercase', 'lowercase', 'capitalize'],
+    'overflow': ['visible', 'hidden', 'scroll', 'auto'],
+    'float': ['none', 'left', 'right'],
+    'clear': ['none', 'left', 'right', 'both'],
+    'visibility': ['visible', 'hidden'],
+    'cursor': ['pointer', 'default', 'text', 'wait', 'help', 'move', 'not-allowed']
+}))
+
+
+# Common CSS framework classes offered in class attributes
+_COMMON_CSS_CLASSES: Tuple[str, ...] = _interned((
+    'container', 'row', 'col', 'col-md-6', 'col-lg-4',
+    'btn', 'btn-primary', 'btn-secondary', 'btn-success', 'btn-danger',
+    'form-control', 'form-group', 'form-label',
+    'nav', 'navbar', 'nav-link', 'nav-item',
+    'card', 'card-body', 'card-header', 'card-footer',
+    'table', 'table-striped', 'table-bordered',
+    'text-center', 'text-left', 'text-right',
+    'd-flex', 'd-block', 'd-none', 'd-inline',
+    'mb-3', 'mt-3', 'p-3', 'm-3'
+))
+
+
+class Jinja2HTMLCompletionProvider:
+    """Comprehensive completion provider for Jinja2 HTML templates."""
+    
+    def __init__(self):
+        self.html_tags = _HTML_TAGS
+        self.html_attributes = _HTML_ATTRIBUTES
+        self.jinja2_filters = _JINJA2_FILTERS
+        self.jinja2_functions = _JINJA2_FUNCTIONS
+        self.jinja2_tests = _JINJA2_TESTS
+        self.jinja2_keywords = _JINJA2_KEYWORDS
+        self.css_properties = _CSS_PROPERTIES
+        self.common_values = _COMMON_ATTRIBUTE_VALUES
+        
+        # Items for static labels never change, so they are built once and
+        # shared across requests
+        self._html_tag_items = self._build_html_tag_items()
+        self._attribute_items = self._build_attribute_items()
+        self._filter_items = self._build_filter_items()
+        self._function_items = self._build_function_items()
+        self._test_items = self._build_test_items()
+        self._keyword_items = self._build_keyword_items()
+        self._css_property_items = self._build_css_property_items()
+        self._common_class_items = self._build_common_class_items()
+        
+        # Attribute value items, built on first use per (attribute, tag)
+        self._attribute_values = self._normalize_attribute_values()
+        self._attribute_value_items = functools.lru_cache(maxsize=256)(self._build_attribute_value_items)
+        
+        # Prefix indexes over the static completion labels
+        self._tag_index = _PrefixIndex(self._html_tag_items.items())
+        self._attribute_index = _PrefixIndex(self._attribute_items.items())
+        self._build_attribute_indexes_by_tag()
+        self._filter_index = _PrefixIndex(self._filter_items.items())
+        self._function_index = _PrefixIndex(self._function_items.items())
+        self._test_index = _PrefixIndex(self._test_items.items())
+        self._keyword_index = _PrefixIndex(self._keyword_items.items())
+        self._css_property_index = _PrefixIndex(self._css_property_items.items())
+        self._common_class_index = _PrefixIndex(self._common_class_items.items())
+        
+        # Cache for extracted variables, classes and IDs, which callers
+        # outside completion get copies of. Extraction results are keyed by
+        # the full document text: the editor hands back the same source
+        # string until the document changes, so a hit costs no rescan and no
+        # rehash, and any edit misses correctly
+        self._document_names_cache = functools.lru_cache(maxsize=8)(self._extract_document_names)
+        
+        # CSS class/ID indexes of open documents, keyed by URI
+        self._document_indexes: Dict[str, _DocumentIndex] = {}
+        
+        # Context analysis depends only on (line, position), so editors
+        # re-requesting the same spot skip the scan entirely
+        self._analyze_cached = functools.lru_cache(maxsize=512)(self._analyze_line)
+        
+        # Completions for contexts that never look at the document, keyed by
+        # (context, word, tag_name)
+        self._static_completions = functools.lru_cache(maxsize=256)(self._compute_static_completions)
+        
+        # Completion getters per context, all called as
+        # getter(request, document_content, document_uri)
+        self._dispatch = {
+            CompletionContext.HTML: self._get_static_completions,
+            CompletionContext.ATTRIBUTE_NAME: self._get_static_completions,
+            CompletionContext.JINJA_EXPRESSION: self._get_jinja_expression_completions,
+            CompletionContext.JINJA_STATEMENT: self._get_jinja_statement_completions,
+            CompletionContext.ATTRIBUTE_VALUE: self._get_attribute_value_completions,
+            CompletionContext.CSS_CLASS: self._get_css_class_completions,
+            CompletionContext.CSS_ID: self._get_css_id_completions,
         }
     
-    def _load_jinja2_keywords(self) -> Dict[str, Dict[str, Any]]:
-        """Load Jinja2 keywords and statements."""
-        return {
-            # Control structures
-            'if': {'description': 'Conditional statement', 'snippet': 'if $1:\n    $2\n{% endif %}$0'},
-            'elif': {'description': 'Else if condition'},
-            'else': {'description': 'Else clause'},
-            'endif': {'description': 'End if statement'},
-            'for': {'description': 'For loop', 'snippet': 'for $1 in $2:\n    $3\n{% endfor %}$0'},
-            'endfor': {'description': 'End for loop'},
-            'while': {'description': 'While loop (if supported)'},
-            'endwhile': {'description': 'End while loop'},
-            'break': {'description': 'Break from loop'},
-            'continue': {'description': 'Continue to next iteration'},
-            
-            # Template inheritance
-            'extends': {'description': 'Extend base template', 'snippet': 'extends "$1"'},
-            'block': {'description': 'Define block', 'snippet': 'block $1:\n    $2\n{% endblock %}$0'},
-            'endblock': {'description': 'End block definition'},
-            'super': {'description': 'Call parent block content'},
-            
-            # Include and import
-            'include': {'description': 'Include another template', 'snippet': 'include "$1"'},
-            'import': {'description': 'Import template', 'snippet': 'import "$1" as $2'},
-            'from': {'description': 'Import from template', 'snippet': 'from "$1" import $2'},
-            
-            # Variables and macros
-            'set': {'description': 'Set variable', 'snippet': 'set $1 = $2'},
-            'macro': {'description': 'Define macro', 'snippet': 'macro $1($2):\n    $3\n{% endmacro %}$0'},
-            'endmacro': {'description': 'End macro definition'},
-            'call': {'description': 'Call macro with content', 'snippet': 'call $1($2):\n    $3\n{% endcall %}$0'},
-            'endcall': {'description': 'End call block'},
+    def _build_html_tag_items(self) -> Dict[str, CompletionItem]:
+        """Build the completion item for every HTML tag."""
+        items = {}
+        
+        for tag, info in self.html_tags.items():
+            snippet = info.get('snippet', f'<{tag}>$1</{tag}>$0')
+            if info.get('void', False):
+                snippet = f'<{tag}$1>$0'
             
-            # Context and scoping
-            'with': {'description': 'Create local scope', 'snippet': 'with $1 = $2:\n    $3\n{% endwith %}$0'},
-            'endwith': {'description': 'End with block'},
-            'without': {'description': 'Without context modifier'},
-            'context': {'description': 'With context modifier'},
-            'ignore': {'description': 'Ignore missing'},
-            'missing': {'description': 'Missing template handling'},
+            items[tag] = CompletionItem(
+                label=tag,
+                kind=CompletionItemKind.Keyword,
+                detail=f"HTML <{tag}> element",
+                documentation=info.get('description', f'HTML {tag} element'),
+                insert_text=snippet,
+                insert_text_format=InsertTextFormat.Snippet
+            )
+        
+        return items
+    
+    def _build_attribute_items(self) -> Dict[str, CompletionItem]:
+        """Build the completion item for every HTML attribute."""
+        items = {}
+        
+        for attr_name, info in self.html_attributes.items():
+            snippet = f'{attr_name}="$1"$0' if not info.get('boolean', False) else attr_name
             
-            # Filters and processing
-            'filter': {'description': 'Apply filter to block', 'snippet': 'filter $1:\n    $2\n{% endfilter %}$0'},
-            'endfilter': {'description': 'End filter block'},
-            'raw': {'description': 'Raw content block', 'snippet': 'raw:\n    $1\n{% endraw %}$0'},
-            'endraw': {'description': 'End raw block'},
+            items[attr_name] = CompletionItem(
+                label=attr_name,
+                kind=CompletionItemKind.Property,
+                detail="HTML attribute",
+                documentation=info.get('description', f'HTML {attr_name} attribute'),
+                insert_text=snippet,
+                insert_text_format=InsertTextFormat.Snippet if '"' in snippet else InsertTextFormat.PlainText
+            )
+        
+        return items
+    
+    def _normalize_attribute_values(self) -> Dict[str, Dict[Optional[str], List[str]]]:
+        """Map each attribute's values by tag, with None keying the values for any tag."""
+        normalized = {}
+        
+        for attr_name, info in self.html_attributes.items():
+            values = info.get('values', [])
+            normalized[attr_name] = values if isinstance(values, dict) else {None: values}
+        
+        return normalized
+    
+    def _build_attribute_indexes_by_tag(self):
+        """Index the attributes applicable to each tag in its own prefix index."""
+        # Attributes without a 'tags' list, or marked global, apply to any tag
+        universal = []
+        by_tag: Dict[str, List[str]] = {}
+        for attr_name, info in self.html_attributes.items():
+            applicable_tags = info.get('tags', [])
+            if not applicable_tags or info.get('global', False):
+                universal.append(attr_name)
+            else:
+                for tag in applicable_tags:
+                    by_tag.setdefault(tag, []).append(attr_name)
+        
+        universal_set = set(universal)
+        self._universal_attribute_index = _PrefixIndex(
+            (attr_name, self._attribute_items[attr_name]) for attr_name in universal
+        )
+        self._attribute_indexes_by_tag = {
+            tag: _PrefixIndex(
+                (attr_name, item) for attr_name, item in self._attribute_items.items()
+                if attr_name in universal_set or attr_name in names
+            )
+            for tag, names in by_tag.items()
+        }
+    
+    def _build_filter_items(self) -> Dict[str, CompletionItem]:
+        """Build the completion item for every Jinja2 filter."""
+        items = {}
+        
+        for filter_name, info in self.jinja2_filters.items():
+            args = info.get('args', [])
+            snippet = f"{filter_name}{_ARGS_SNIPPET[len(args)]}" if args else filter_name
             
-            # Auto-escaping
-            'autoescape': {'description': 'Auto-escape block', 'snippet': 'autoescape $1:\n    $2\n{% endautoescape %}$0'},
-            'endautoescape': {'description': 'End auto-escape block'},
+            items[filter_name] = CompletionItem(
+                label=filter_name,
+                kind=CompletionItemKind.Function,
+                detail="Jinja2 filter",
+                documentation=info['description'],
+                insert_text=snippet,
+                insert_text_format=InsertTextFormat.Snippet if args else InsertTextFormat.PlainText
+            )
+        
+        return items
+    
+    def _build_function_items(self) -> Dict[str, CompletionItem]:
+        """Build the completion item for every Jinja2 global function."""
+        items = {}
+        
+        for func_name, info in self.jinja2_functions.items():
+            args = info.get('args', [])
+            snippet = f"{func_name}{_ARGS_SNIPPET[len(args)]}"
             
-            # Operators and logic
-            'and': {'description': 'Logical AND operator'},
-            'or': {'description': 'Logical OR operator'},
-            'not': {'description': 'Logical NOT operator'},
-            'is': {'description': 'Test operator'},
-            'in': {'description': 'Membership test operator'},
-            'as': {'description': 'Alias operator'},
+            items[func_name] = CompletionItem(
+                label=func_name,
+                kind=CompletionItemKind.Function,
+                detail="Jinja2 function",
+                documentation=info['description'],
+                insert_text=snippet,
+                insert_text_format=InsertTextFormat.Snippet
+            )
+        
+        return items
+    
+    def _build_test_items(self) -> Dict[str, CompletionItem]:
+        """Build the completion item for every Jinja2 test."""
+        return {
+            test_name: CompletionItem(
+                label=test_name,
+                kind=CompletionItemKind.Function,
+                detail="Jinja2 test",
+                documentation=info['description'],
+                insert_text=test_name
+            )
+            for test_name, info in self.jinja2_tests.items()
+        }
+    
+    def _build_keyword_items(self) -> Dict[str, CompletionItem]:
+        """Build the completion item for every Jinja2 keyword."""
+        items = {}
+        
+        for keyword, info in self.jinja2_keywords.items():
+            snippet = info.get('snippet', keyword)
             
-            # Internationalization (if enabled)
-            'trans': {'description': 'Translation block', 'snippet': 'trans:\n    $1\n{% endtrans %}$0'},
-            'endtrans': {'description': 'End translation block'},
-            'pluralize': {'description': 'Pluralization in trans block'},
+            items[keyword] = CompletionItem(
+                label=keyword,
+                kind=CompletionItemKind.Keyword,
+                detail="Jinja2 keyword",
+                documentation=info['description'],
+                insert_text=snippet,
+                insert_text_format=InsertTextFormat.Snippet if '$' in snippet else InsertTextFormat.PlainText
+            )
+        
+        return items
+    
+    def _build_css_property_items(self) -> Dict[str, CompletionItem]:
+        """Build the completion item for every CSS property."""
+        items = {}
+        
+        for prop in self.css_properties:
+            values = self.common_values.get(prop, [])
+            snippet = f"{prop}: $1;" if not values else f"{prop}: ${{1|{','.join(values)}|}};"
             
-            # Miscellaneous
-            'do': {'description': 'Execute expression without output', 'snippet': 'do $1'}
-        }
+            items[prop] = CompletionItem(
+                label=prop,
+                kind=CompletionItemKind.Property,
+                detail="CSS property",
+                insert_text=snippet,
+                insert_text_format=InsertTextFormat.Snippet
+            )
+        
+        return items
     
-    def _load_css_properties(self) -> List[str]:
-        """Load common CSS properties for style attribute completion."""
-        return [
-            'color', 'background-color', 'font-size', 'font-family', 'font-weight',
-            'margin', 'margin-top', 'margin-right', 'margin-bottom', 'margin-left',
-            'padding', 'padding-top', 'padding-right', 'padding-bottom', 'padding-left',
-            'border', 'border-top', 'border-right', 'border-bottom', 'border-left',
-            'border-color', 'border-width', 'border-style', 'border-radius',
-            'width', 'height', 'max-width', 'max-height', 'min-width', 'min-height',
-            'display', 'position', 'top', 'right', 'bottom', 'left', 'z-index',
-            'float', 'clear', 'overflow', 'visibility', 'opacity',
-            'text-align', 'text-decoration', 'text-transform', 'line-height',
-            'vertical-align', 'white-space', 'word-wrap', 'word-break',
-            'flex', 'flex-direction', 'justify-content', 'align-items', 'align-content',
-            'grid', 'grid-template-columns', 'grid-template-rows', 'grid-gap',
-            'box-shadow', 'text-shadow', 'transform', 'transition', 'animation'
-        ]
-    
-    def _load_common_attribute_values(self) -> Dict[str, List[str]]:
-        """Load common values for HTML attributes."""
+    def _build_common_class_items(self) -> Dict[str, CompletionItem]:
+        """Build the completion item for every common CSS framework class."""
         return {
-            'display': ['block', 'inline', 'inline-block', 'flex', 'grid', 'none', 'table', 'table-cell'],
-            'position': ['static', 'relative', 'absolute', 'fixed', 'sticky'],
-            'text-align': ['left', 'center', 'right', 'justify'],
-            'font-weight': ['normal', 'bold', '100', '200', '300', '400', '500', '600', '700', '800', '900'],
-            'font-style': ['normal', 'italic', 'oblique'],
-            'text-decoration': ['none', 'underline', 'overline', 'line-through'],
-            'text-transform': ['none', 'uppercase', 'lowercase', 'capitalize'],
-            'overflow': ['visible', 'hidden', 'scroll', 'auto'],
-            'float': ['none', 'left', 'right'],
-            'clear': ['none', 'left', 'right', 'both'],
-            'visibility': ['visible', 'hidden'],
-            'cursor': ['pointer', 'default', 'text', 'wait', 'help', 'move', 'not-allowed']
+            class_name: CompletionItem(
+                label=class_name,
+                kind=CompletionItemKind.Value,
+                detail="CSS class",
+                insert_text=class_name
+            )
+            for class_name in _COMMON_CSS_CLASSES
         }
     
+    def _build_attribute_value_items(self, attr_name: str, tag_name: Optional[str]) -> Tuple[CompletionItem, ...]:
+        """Build the value completion items for an attribute on a tag."""
+        values_by_tag = self._attribute_values.get(attr_name, {})
+        values = values_by_tag.get(tag_name) or values_by_tag.get(None, [])
+        
+        return tuple(
+            CompletionItem(
+                label=value,
+                kind=CompletionItemKind.Value,
+                detail=f"{attr_name} value",
+                insert_text=value
+            )
+            for value in values
+        )
+    
     def analyze_completion_context(self, line: str, position: int) -> CompletionRequest:
         """Analyze the context for completion."""
-        word_start = position
-        word_end = position
+        word, prefix, context, inside_quotes, tag_name = self._analyze_cached(line, position)
         
-        # Find word boundaries
-        while word_start > 0 and (line[word_start - 1].isalnum() or line[word_start - 1] in '_-.:'):
+        return CompletionRequest(
+            position=_line_position(position),
+            line=line,
+            word=word,
+            prefix=prefix,
+            context=context,
+            inside_quotes=inside_quotes,
+            tag_name=tag_name
+        )
+    
+    def _analyze_line(self, line: str, position: int) -> Tuple[str, str, CompletionContext, bool, Optional[str]]:
+        """Compute (word, prefix, context, inside_quotes, tag_name) for a cursor position."""
+        # Find word boundaries; the end is one regex match, the start a
+        # backwards walk that only calls isalnum() for non-ASCII characters
+        word_start = position
+        while word_start > 0 and (line[word_start - 1] in _WORD_CHARS or line[word_start - 1].isalnum()):
             word_start -= 1
-        while word_end < len(line) and (line[word_end].isalnum() or line[word_end] in '_-.:'):
-            word_end += 1
+        word_end = _WORD_END_RE.match(line, position).end()
         
         word = line[word_start:word_end]
         prefix = line[:position]
         
-        # Determine context
-        context = self._determine_context(line, position)
-        
-        # Check if inside quotes
+        # Check if inside quotes; the context check reuses the result
         inside_quotes = self._is_inside_quotes(line, position)
         
+        # Determine context
+        context = self._determine_context(line, position, inside_quotes)
+        
         # Get current tag name if applicable
         tag_name = self._get_current_tag(line, position)
         
-        return CompletionRequest(
-            position=Position(line=0, character=position),
-            line=line,
-            word=word,
-            prefix=prefix,
-            context=context,
-            inside_quotes=inside_quotes,
-            tag_name=tag_name
-        )
+        return word, prefix, context, inside_quotes, tag_name
     
-    def _determine_context(self, line: str, position: int) -> CompletionContext:
+    def _determine_context(self, line: str, position: int,
+                           inside_quotes: Optional[bool] = None) -> CompletionContext:
         """Determine the completion context."""
         # Check for Jinja2 contexts first
-        before_cursor = line[:position]
-        
-        # Jinja2 expression {{ }}
-        expr_start = before_cursor.rfind('{{')
-        expr_end = before_cursor.rfind('}}')
-        if expr_start > expr_end:
-            return CompletionContext.JINJA_EXPRESSION
-        
-        # Jinja2 statement {% %}
-        stmt_start = before_cursor.rfind('{%')
-        stmt_end = before_cursor.rfind('%}')
-        if stmt_start > stmt_end:
-            return CompletionContext.JINJA_STATEMENT
-        
-        # Jinja2 comment {# #}
-        comment_start = before_cursor.rfind('{#')
-        comment_end = before_cursor.rfind('#}')
-        if comment_start > comment_end:
-            return CompletionContext.JINJA_COMMENT
+        jinja_context = self._find_open_jinja_block(line, position)
+        if jinja_context is not None:
+            return jinja_context
         
         # HTML attribute value
         if self._is_in_attribute_value(line, position):
             return CompletionContext.ATTRIBUTE_VALUE
         
         # HTML attribute name
-        if self._is_in_attribute_name(line, position):
+        if self._is_in_attribute_name(line, position, inside_quotes):
             return CompletionContext.ATTRIBUTE_NAME
         
         # CSS class (class="...")
@@ -543,368 +1140,259 @@ class Jinja2HTMLCompletionProvider:
         
         return CompletionContext.HTML
     
+    def _find_open_jinja_block(self, line: str, position: int) -> Optional[CompletionContext]:
+        """Find the Jinja2 block left open before the cursor, if any."""
+        # One scan over the text before the cursor; the last delimiter of
+        # each kind decides whether that kind is still open
+        is_open = {}
+        for match in _JINJA_DELIMITER_RE.finditer(line, 0, position):
+            context, opens = _JINJA_DELIMITERS[match.group(1)]
+            is_open[context] = opens
+        
+        for context in (CompletionContext.JINJA_EXPRESSION,
+                        CompletionContext.JINJA_STATEMENT,
+                        CompletionContext.JINJA_COMMENT):
+            if is_open.get(context):
+                return context
+        return None
+    
     def _is_inside_quotes(self, line: str, position: int) -> bool:
         """Check if position is inside quotes."""
-        before_cursor = line[:position]
-        double_quotes = before_cursor.count('"') - before_cursor.count('\\"')
-        single_quotes = before_cursor.count("'") - before_cursor.count("\\'")
-        return (double_quotes % 2 == 1) or (single_quotes % 2 == 1)
+        # Visit only the quotes and escapes before the cursor; a quote of one
+        # kind inside a string of the other kind does not toggle state
+        in_single = in_double = False
+        for match in _QUOTE_TOKEN_RE.finditer(line, 0, position):
+            ch = match.group()
+            if ch == '"':
+                if not in_single:
+                    in_double = not in_double
+            elif ch == "'":
+                if not in_double:
+                    in_single = not in_single
+        return in_single or in_double
     
     def _get_current_tag(self, line: str, position: int) -> Optional[str]:
         """Get the current HTML tag name."""
-        before_cursor = line[:position]
-        tag_match = re.search(r'<(\w+)[^>]*$', before_cursor)
+        tag_match = _TAG_RE.search(line, 0, position)
         return tag_match.group(1) if tag_match else None
     
     def _is_in_attribute_value(self, line: str, position: int) -> bool:
         """Check if position is in an attribute value."""
-        before_cursor = line[:position]
         # Look for pattern: attr="value_here or attr='value_here
-        return bool(re.search(r'\w+\s*=\s*["\'][^"\']*$', before_cursor))
+        return bool(_ATTR_VALUE_RE.search(line, 0, position))
     
-    def _is_in_attribute_name(self, line: str, position: int) -> bool:
+    def _is_in_attribute_name(self, line: str, position: int,
+                              inside_quotes: Optional[bool] = None) -> bool:
         """Check if position is in an attribute name."""
-        before_cursor = line[:position]
         # After < and tag name, but not in quotes
-        if self._is_inside_quotes(line, position):
+        if inside_quotes is None:
+            inside_quotes = self._is_inside_quotes(line, position)
+        if inside_quotes:
             return False
-        return bool(re.search(r'<\w+[^>]*\s+[\w-]*$', before_cursor))
+        return bool(_ATTR_NAME_RE.search(line, 0, position))
     
     def _is_in_css_class(self, line: str, position: int) -> bool:
         """Check if position is in CSS class attribute."""
-        before_cursor = line[:position]
-        return bool(re.search(r'class\s*=\s*["\'][^"\']*$', before_cursor))
+        return bool(_CSS_CLASS_RE.search(line, 0, position))
     
     def _is_in_css_id(self, line: str, position: int) -> bool:
         """Check if position is in CSS ID attribute."""
-        before_cursor = line[:position]
-        return bool(re.search(r'id\s*=\s*["\'][^"\']*$', before_cursor))
+        return bool(_CSS_ID_RE.search(line, 0, position))
     
-    def provide_completions(self, request: CompletionRequest, document_content: str = "") -> List[CompletionItem]:
-        """Provide completions based on context."""
-        completions = []
-        
-        if request.context == CompletionContext.HTML:
-            completions.extend(self._get_html_completions(request))
-            completions.extend(self._get_emmet_completions(request))
-        
-        elif request.context == CompletionContext.JINJA_EXPRESSION:
-            completions.extend(self._get_jinja_expression_completions(request, document_content))
-        
-        elif request.context == CompletionContext.JINJA_STATEMENT:
-            completions.extend(self._get_jinja_statement_completions(request, document_content))
-        
-        elif request.context == CompletionContext.ATTRIBUTE_NAME:
-            completions.extend(self._get_attribute_name_completions(request))
-        
-        elif request.context == CompletionContext.ATTRIBUTE_VALUE:
-            completions.extend(self._get_attribute_value_completions(request))
-        
-        elif request.context == CompletionContext.CSS_CLASS:
-            completions.extend(self._get_css_class_completions(request, document_content))
-        
-        elif request.context == CompletionContext.CSS_ID:
-            completions.extend(self._get_css_id_completions(request, document_content))
+    def update_document_index(self, uri: str, source: str):
+        """Bring the CSS class/ID index of an open document up to date."""
+        index = self._document_indexes.get(uri)
+        if index is None:
+            index = self._document_indexes[uri] = _DocumentIndex()
+        index.update(source)
+    
+    def remove_document_index(self, uri: str):
+        """Forget the index of a closed document."""
+        self._document_indexes.pop(uri, None)
+    
+    def provide_completions(self, request: CompletionRequest, document_content: str = "",
+                            document_uri: Optional[str] = None,
+                            max_items: Optional[int] = None) -> List[CompletionItem]:
+        """Provide completions based on context, at most max_items of them if given."""
+        getter = self._dispatch.get(request.context)
+        if getter is None:
+            return []
         
-        # Filter completions by prefix
-        if request.word:
-            completions = [c for c in completions if c.label.lower().startswith(request.word.lower())]
+        # Each getter already filters by request.word and yields lazily, so
+        # a cap stops the remaining work as soon as it is reached
+        return list(itertools.islice(getter(request, document_content, document_uri), max_items))
+    
+    def _get_static_completions(self, request: CompletionRequest, document_content: str = "",
+                                document_uri: Optional[str] = None) -> Iterator[CompletionItem]:
+        """Get cached completions for contexts that never read the document."""
+        tag_name = request.tag_name if request.context == CompletionContext.ATTRIBUTE_NAME else None
+        yield from self._static_completions(request.context, request.word, tag_name)
+    
+    def _compute_static_completions(self, context: CompletionContext, word: str,
+                                    tag_name: Optional[str]) -> Tuple[CompletionItem, ...]:
+        """Compute completions that depend only on context, word and tag."""
+        request = CompletionRequest(
+            position=_line_position(len(word)),
+            line=word,
+            word=word,
+            prefix=word,
+            context=context,
+            tag_name=tag_name
+        )
         
-        return completions
+        if context == CompletionContext.HTML:
+            return tuple(itertools.chain(self._get_html_completions(request), self._get_emmet_completions(request)))
+        return tuple(self._get_attribute_name_completions(request))
     
-    def _get_html_completions(self, request: CompletionRequest) -> List[CompletionItem]:
+    def _get_html_completions(self, request: CompletionRequest) -> Iterator[CompletionItem]:
         """Get HTML tag completions."""
-        completions = []
-        
-        for tag, info in self.html_tags.items():
-            if not request.word or tag.startswith(request.word.lower()):
-                snippet = info.get('snippet', f'<{tag}>$1</{tag}>$0')
-                if info.get('void', False):
-                    snippet = f'<{tag}$1>$0'
-                
-                completions.append(CompletionItem(
-                    label=tag,
-                    kind=CompletionItemKind.Keyword,
-                    detail=f"HTML <{tag}> element",
-                    documentation=info.get('description', f'HTML {tag} element'),
-                    insert_text=snippet,
-                    insert_text_format=InsertTextFormat.Snippet
-                ))
-        
-        return completions
+        yield from self._tag_index.values_with_prefix(request.word.lower())
     
-    def _get_emmet_completions(self, request: CompletionRequest) -> List[CompletionItem]:
+    def _get_emmet_completions(self, request: CompletionRequest) -> Iterator[CompletionItem]:
         """Get Emmet snippet completions."""
-        return [
-            CompletionItem(
-                label=item['label'],
-                kind=CompletionItemKind.Snippet,
-                detail=item['detail'],
-                documentation=item['documentation'],
-                insert_text=item['insert_text'],
-                insert_text_format=InsertTextFormat.Snippet
-            )
-            for item in emmet_integration.get_jinja_completions(request.word)
-        ]
+        word = request.word.lower()
+        for item in emmet_integration.get_jinja_completions(request.word):
+            if item['label_lc'].startswith(word):
+                yield CompletionItem(
+                    label=item['label'],
+                    kind=CompletionItemKind.Snippet,
+                    detail=item['detail'],
+                    documentation=item['documentation'],
+                    insert_text=item['insert_text'],
+                    insert_text_format=InsertTextFormat.Snippet
+                )
     
-    def _get_jinja_expression_completions(self, request: CompletionRequest, document_content: str) -> List[CompletionItem]:
+    def _get_jinja_expression_completions(self, request: CompletionRequest, document_content: str,
+                                          document_uri: Optional[str] = None) -> Iterator[CompletionItem]:
         """Get completions for Jinja2 expressions {{ }}."""
-        completions = []
-        
         # Variables from document
-        variables = self._extract_variables(document_content)
-        for var in variables:
-            if not request.word or var.startswith(request.word):
-                completions.append(CompletionItem(
-                    label=var,
-                    kind=CompletionItemKind.Variable,
-                    detail="Template variable",
-                    documentation=f"Variable: {var}"
-                ))
+        variables = self._document_names_cache(document_content)[0]
+        for var in _filter_prefix(variables, request.word):
+            yield _variable_item(var)
         
         # Filters
-        for filter_name, info in self.jinja2_filters.items():
-            if not request.word or filter_name.startswith(request.word):
-                args = info.get('args', [])
-                snippet = f"{filter_name}" + (f"({', '.join(f'${i+1}' for i in range(len(args)))})" if args else "")
-                
-                completions.append(CompletionItem(
-                    label=filter_name,
-                    kind=CompletionItemKind.Function,
-                    detail="Jinja2 filter",
-                    documentation=info['description'],
-                    insert_text=snippet,
-                    insert_text_format=InsertTextFormat.Snippet if args else InsertTextFormat.PlainText
-                ))
+        yield from self._filter_index.values_with_prefix(request.word)
         
         # Functions
-        for func_name, info in self.jinja2_functions.items():
-            if not request.word or func_name.startswith(request.word):
-                args = info.get('args', [])
-                snippet = f"{func_name}({', '.join(f'${i+1}' for i in range(len(args)))})"
-                
-                completions.append(CompletionItem(
-                    label=func_name,
-                    kind=CompletionItemKind.Function,
-                    detail="Jinja2 function",
-                    documentation=info['description'],
-                    insert_text=snippet,
-                    insert_text_format=InsertTextFormat.Snippet
-                ))
-        
-        return completions
+        yield from self._function_index.values_with_prefix(request.word)
     
-    def _get_jinja_statement_completions(self, request: CompletionRequest, document_content: str) -> List[CompletionItem]:
+    def _get_jinja_statement_completions(self, request: CompletionRequest, document_content: str,
+                                         document_uri: Optional[str] = None) -> Iterator[CompletionItem]:
         """Get completions for Jinja2 statements {% %}."""
-        completions = []
-        
         # Keywords
-        for keyword, info in self.jinja2_keywords.items():
-            if not request.word or keyword.startswith(request.word):
-                snippet = info.get('snippet', keyword)
-                
-                completions.append(CompletionItem(
-                    label=keyword,
-                    kind=CompletionItemKind.Keyword,
-                    detail="Jinja2 keyword",
-                    documentation=info['description'],
-                    insert_text=snippet,
-                    insert_text_format=InsertTextFormat.Snippet if '$' in snippet else InsertTextFormat.PlainText
-                ))
+        yield from self._keyword_index.values_with_prefix(request.word)
         
         # Tests (for use with 'is' operator)
-        for test_name, info in self.jinja2_tests.items():
-            if not request.word or test_name.startswith(request.word):
-                completions.append(CompletionItem(
-                    label=test_name,
-                    kind=CompletionItemKind.Function,
-                    detail="Jinja2 test",
-                    documentation=info['description'],
-                    insert_text=test_name
-                ))
+        yield from self._test_index.values_with_prefix(request.word)
         
         # Variables
-        variables = self._extract_variables(document_content)
-        for var in variables:
-            if not request.word or var.startswith(request.word):
-                completions.append(CompletionItem(
-                    label=var,
-                    kind=CompletionItemKind.Variable,
-                    detail="Template variable",
-                    documentation=f"Variable: {var}"
-                ))
-        
-        return completions
-    
-    def _get_attribute_name_completions(self, request: CompletionRequest) -> List[CompletionItem]:
+        variables = self._document_names_cache(document_content)[0]
+        for var in _filter_prefix(variables, request.word):
+            yield _variable_item(var)
+    
+    def _get_attribute_name_completions(self, request: CompletionRequest) -> Iterator[CompletionItem]:
         """Get HTML attribute name completions."""
-        completions = []
+        # Only offer attributes applicable to the current tag
+        if request.tag_name:
+            index = self._attribute_indexes_by_tag.get(request.tag_name, self._universal_attribute_index)
+        else:
+            index = self._attribute_index
         
-        for attr_name, info in self.html_attributes.items():
-            # Check if attribute is applicable to current tag
-            if request.tag_name:
-                applicable_tags = info.get('tags', [])
-                if applicable_tags and request.tag_name not in applicable_tags and not info.get('global', False):
-                    continue
-            
-            if not request.word or attr_name.startswith(request.word):
-                snippet = f'{attr_name}="$1"$0' if not info.get('boolean', False) else attr_name
-                
-                completions.append(CompletionItem(
-                    label=attr_name,
-                    kind=CompletionItemKind.Property,
-                    detail="HTML attribute",
-                    documentation=info.get('description', f'HTML {attr_name} attribute'),
-                    insert_text=snippet,
-                    insert_text_format=InsertTextFormat.Snippet if '"' in snippet else InsertTextFormat.PlainText
-                ))
-        
-        return completions
-    
-    def _get_attribute_value_completions(self, request: CompletionRequest) -> List[CompletionItem]:
+        yield from index.values_with_prefix(request.word)
+    
+    def _get_attribute_value_completions(self, request: CompletionRequest, document_content: str = "",
+                                         document_uri: Optional[str] = None) -> Iterator[CompletionItem]:
         """Get HTML attribute value completions."""
-        completions = []
-        
         # Extract attribute name from context
-        attr_match = re.search(r'(\w+)\s*=\s*["\'][^"\']*$', request.prefix)
+        attr_match = _ATTR_CTX_RE.search(request.prefix)
         if not attr_match:
-            return completions
+            return
         
         attr_name = attr_match.group(1)
-        attr_info = self.html_attributes.get(attr_name, {})
         
         # Get values for this attribute
-        values = attr_info.get('values', [])
-        if isinstance(values, dict) and request.tag_name:
-            values = values.get(request.tag_name, [])
-        
-        for value in values:
-            if not request.word or value.startswith(request.word):
-                completions.append(CompletionItem(
-                    label=value,
-                    kind=CompletionItemKind.Value,
-                    detail=f"{attr_name} value",
-                    insert_text=value
-                ))
+        for item in self._attribute_value_items(attr_name, request.tag_name):
+            if not request.word or item.label.startswith(request.word):
+                yield item
         
         # Add CSS property completions for style attribute
         if attr_name == 'style':
-            for prop in self.css_properties:
-                if not request.word or prop.startswith(request.word):
-                    values = self.common_values.get(prop, [])
-                    snippet = f"{prop}: $1;" if not values else f"{prop}: ${{1|{','.join(values)}|}};"
-                    
-                    completions.append(CompletionItem(
-                        label=prop,
-                        kind=CompletionItemKind.Property,
-                        detail="CSS property",
-                        insert_text=snippet,
-                        insert_text_format=InsertTextFormat.Snippet
-                    ))
-        
-        return completions
-    
-    def _get_css_class_completions(self, request: CompletionRequest, document_content: str) -> List[CompletionItem]:
+            yield from self._css_property_index.values_with_prefix(request.word)
+    
+    def _get_css_class_completions(self, request: CompletionRequest, document_content: str,
+                                   document_uri: Optional[str] = None) -> Iterator[CompletionItem]:
         """Get CSS class completions."""
-        completions = []
-        
-        # Extract existing classes from document
-        classes = self._extract_css_classes(document_content)
-        
-        for class_name in classes:
-            if not request.word or class_name.startswith(request.word):
-                completions.append(CompletionItem(
-                    label=class_name,
-                    kind=CompletionItemKind.Value,
-                    detail="CSS class",
-                    insert_text=class_name
-                ))
-        
-        # Add common CSS framework classes
-        common_classes = [
-            'container', 'row', 'col', 'col-md-6', 'col-lg-4',
-            'btn', 'btn-primary', 'btn-secondary', 'btn-success', 'btn-danger',
-            'form-control', 'form-group', 'form-label',
-            'nav', 'navbar', 'nav-link', 'nav-item',
-            'card', 'card-body', 'card-header', 'card-footer',
-            'table', 'table-striped', 'table-bordered',
-            'text-center', 'text-left', 'text-right',
-            'd-flex', 'd-block', 'd-none', 'd-inline',
-            'mb-3', 'mt-3', 'p-3', 'm-3'
-        ]
-        
-        for class_name in common_classes:
-            if not request.word or class_name.startswith(request.word):
-                completions.append(CompletionItem(
-                    label=class_name,
-                    kind=CompletionItemKind.Value,
-                    detail="CSS class",
-                    insert_text=class_name
-                ))
-        
-        return completions
-    
-    def _get_css_id_completions(self, request: CompletionRequest, document_content: str) -> List[CompletionItem]:
-        """Get CSS ID completions."""
-        completions = []
+        # The most used matching classes from the document index, or a full
+        # scan when the document is not indexed
+        index = self._document_indexes.get(document_uri)
+        if index is not None:
+            classes = index.class_trie.top_k(request.word, _DOCUMENT_NAME_LIMIT)
+        else:
+            classes = self._document_names_cache(document_content)[1]
         
-        # Extract existing IDs from document
-        ids = self._extract_css_ids(document_content)
+        offered = set()
+        for class_name in _filter_prefix(classes, request.word):
+            offered.add(class_name)
+            yield _css_class_item(class_name)
         
-        for id_name in ids:
-            if not request.word or id_name.startswith(request.word):
-                completions.append(CompletionItem(
-                    label=id_name,
-                    kind=CompletionItemKind.Value,
-                    detail="CSS ID",
-                    insert_text=id_name
-                ))
+        # Add common CSS framework classes not already used in the document
+        for class_name, item in self._common_class_index.items_with_prefix(request.word):
+            if class_name not in offered:
+                yield item
+    
+    def _get_css_id_completions(self, request: CompletionRequest, document_content: str,
+                                document_uri: Optional[str] = None) -> Iterator[CompletionItem]:
+        """Get CSS ID completions."""
+        # The most used matching IDs from the document index, or a full scan
+        # when the document is not indexed
+        index = self._document_indexes.get(document_uri)
+        if index is not None:
+            ids = index.id_trie.top_k(request.word, _DOCUMENT_NAME_LIMIT)
+        else:
+            ids = self._document_names_cache(document_content)[2]
         
-        return completions
+        for id_name in _filter_prefix(ids, request.word):
+            yield _css_id_item(id_name)
     
-    def _extract_variables(self, content: str) -> Set[str]:
-        """Extract Jinja2 variables from template content."""
+    def _extract_document_names(self, content: str) -> Tuple[Set[str], Set[str], Set[str]]:
+        """Extract (variables, CSS classes, CSS IDs) from template content in one scan."""
         variables = set()
+        classes = set()
+        ids = set()
         
-        # Variables in expressions {{ var }}
-        expr_pattern = r'\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*(?:\.[a-zA-Z_][a-zA-Z0-9_]*)*)'
-        matches = re.findall(expr_pattern, content)
-        for match in matches:
-            variables.add(match.split('.')[0])
-        
-        # Variables in statements {% for var in ... %}
-        for_pattern = r'\{%\s*for\s+([a-zA-Z_][a-zA-Z0-9_]*)'
-        matches = re.findall(for_pattern, content)
-        variables.update(matches)
-        
-        # Variables in set statements {% set var = ... %}
-        set_pattern = r'\{%\s*set\s+([a-zA-Z_][a-zA-Z0-9_]*)'
-        matches = re.findall(set_pattern, content)
-        variables.update(matches)
+        # Matches of one kind must not overlap, as with a findall() per
+        # kind, so skip any that start inside the previous match's span
+        kind_end = {}
+        for match in _DOCUMENT_NAMES_RE.finditer(content):
+            kind = match.lastgroup
+            start = match.start()
+            if start < kind_end.get(kind, 0):
+                continue
+            kind_end[kind] = match.end(kind)
+            
+            name = match.group(kind + '_name')
+            if kind == 'expr':
+                # Variables in expressions {{ var }}
+                variables.add(name.split('.')[0])
+            elif kind == 'cls':
+                # Split by whitespace to get individual classes
+                classes.update(name.split())
+            elif kind == 'id':
+                ids.add(name)
+            else:
+                # Variables in {% for var in ... %} and {% set var = ... %}
+                variables.add(name)
         
-        return variables
+        return variables, classes, ids
+    
+    def _extract_variables(self, content: str) -> Set[str]:
+        """Extract Jinja2 variables from template content."""
+        return set(self._document_names_cache(content)[0])
     
     def _extract_css_classes(self, content: str) -> Set[str]:
         """Extract CSS classes from template content."""
-        classes = set()
-        
-        # Find class attributes
-        class_pattern = r'class\s*=\s*["\']([^"\']+)["\']'
-        matches = re.findall(class_pattern, content)
-        
-        for match in matches:
-            # Split by whitespace to get individual classes
-            classes.update(match.split())
-        
-        return classes
+        return set(self._document_names_cache(content)[1])
     
     def _extract_css_ids(self, content: str) -> Set[str]:
         """Extract CSS IDs from template content."""
-        ids = set()
-        
-        # Find id attributes
-        id_pattern = r'id\s*=\s*["\']([^"\']+)["\']'
-        matches = re.findall(id_pattern, content)
-        ids.update(matches)
-        
-        return ids
\ No newline at end of file
+        return set(self._document_names_cache(content)[2])
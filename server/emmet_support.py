@@ -4,12 +4,94 @@ Advanced Emmet Support for Jinja2 HTML Language Server
 Provides comprehensive Emmet abbreviation expansion with Jinja2 template integration.
 """
 
+import bisect
 import re
+import string
+import sys
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 
 
-@dataclass
+# Abbreviation patterns, compiled once at import
+_SPLIT_TOKEN_RE = re.compile(r'[()\[\]{},]')
+
+# Character and tag classes tested with `in`
+_OPEN_BRACKETS = frozenset('([{')
+_FORM_TAGS = frozenset({'input', 'select', 'textarea', 'form'})
+_TAG_CHARS = frozenset(string.ascii_letters + string.digits + '-')
+_NAME_CHARS = _TAG_CHARS | {'_'}
+_OPERATORS = frozenset('>+^()')
+
+# Abbreviations offered as Emmet completions, with their descriptions
+_EMMET_PATTERNS = (
+    ('div.class', 'div with class'),
+    ('div#id', 'div with ID'),
+    ('ul>li*3', 'unordered list with 3 items'),
+    ('table>tr>td*3', 'table with row and 3 cells'),
+    ('form>input[type=text]+input[type=submit]', 'form with text input and submit button'),
+    ('nav>ul>li*5>a', 'navigation with 5 menu items'),
+    ('header+main+footer', 'page structure'),
+    ('article>h1+p*3', 'article with heading and paragraphs'),
+    ('section.container>div.row>div.col*3', 'grid layout'),
+    ('img[src alt]', 'image with attributes'),
+)
+
+# Jinja2 enhanced patterns offered as completions, with their descriptions
+_JINJA_PATTERNS = (
+    ('j:form', 'Jinja2 form with CSRF'),
+    ('j:table', 'Jinja2 table iteration'),
+    ('j:list', 'Jinja2 list iteration'),
+    ('j:select', 'Jinja2 select with options'),
+    ('j:if-form', 'Jinja2 form field with error handling'),
+)
+
+
+def _tokenize(expr: str) -> List[Tuple[str, str]]:
+    """Split an abbreviation into (kind, value) tokens in a single pass."""
+    tokens = []
+    i = 0
+    length = len(expr)
+    
+    while i < length:
+        char = expr[i]
+        end = i + 1
+        
+        if char in _TAG_CHARS:
+            while end < length and expr[end] in _TAG_CHARS:
+                end += 1
+            tokens.append(('TAG', expr[i:end]))
+        elif char == '#' or char == '.':
+            while end < length and expr[end] in _NAME_CHARS:
+                end += 1
+            if end > i + 1:
+                tokens.append(('ID' if char == '#' else 'CLASS', expr[i + 1:end]))
+            else:
+                tokens.append(('', char))
+        elif char == '[' or char == '{':
+            close = expr.find(']' if char == '[' else '}', end)
+            if close == -1:
+                tokens.append(('', char))
+            else:
+                if char == '{':
+                    tokens.append(('CONTENT', expr[end:close]))
+                elif close > end:
+                    tokens.append(('ATTR', expr[end:close]))
+                end = close + 1
+        elif char == '*':
+            while end < length and expr[end].isdigit():
+                end += 1
+            tokens.append(('*', expr[i + 1:end]) if end > i + 1 else ('', char))
+        elif char in _OPERATORS:
+            tokens.append((char, char))
+        elif not char.isspace():
+            tokens.append(('', char))
+        
+        i = end
+    
+    return tokens
+
+
+@dataclass(**({'slots': True} if sys.version_info >= (3, 10) else {}))
 class EmmetNode:
     """Represents a node in the Emmet AST."""
     tag: str
@@ -20,13 +102,15 @@ class EmmetNode:
     children: List['EmmetNode']
     repeat: int = 1
     climb_up: int = 0
+    classes_joined: Optional[str] = None
 
 
 class EmmetParser:
     """Parse Emmet abbreviations into structured nodes."""
     
     def __init__(self):
-        self.html5_tags = {
+        # Interned so tag comparisons against parsed names are mostly identity checks
+        self.html5_tags = frozenset(map(sys.intern, {
             'a', 'abbr', 'address', 'area', 'article', 'aside', 'audio', 'b',
             'base', 'bdi', 'bdo', 'blockquote', 'body', 'br', 'button', 'canvas',
             'caption', 'cite', 'code', 'col', 'colgroup', 'data', 'datalist',
@@ -41,12 +125,12 @@ class EmmetParser:
             'strong', 'style', 'sub', 'summary', 'sup', 'table', 'tbody', 'td',
             'template', 'textarea', 'tfoot', 'th', 'thead', 'time', 'title', 'tr',
             'track', 'u', 'ul', 'var', 'video', 'wbr'
-        }
+        }))
         
-        self.void_elements = {
+        self.void_elements = frozenset(map(sys.intern, {
             'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
             'link', 'meta', 'param', 'source', 'track', 'wbr'
-        }
+        }))
         
         self.snippets = {
             '!': '<!DOCTYPE html>\n<html lang="en">\n<head>\n    <meta charset="UTF-8">\n    <meta name="viewport" content="width=device-width, initial-scale=1.0">\n    <title>$1</title>\n</head>\n<body>\n    $0\n</body>\n</html>',
@@ -57,13 +141,14 @@ class EmmetParser:
 
     def parse(self, abbreviation: str) -> List[EmmetNode]:
         """Parse an Emmet abbreviation into nodes."""
-        if abbreviation in self.snippets:
+        snippet = self.snippets.get(abbreviation)
+        if snippet is not None:
             return [EmmetNode(
                 tag='snippet',
                 attributes={},
                 classes=[],
                 id=None,
-                content=self.snippets[abbreviation],
+                content=snippet,
                 children=[]
             )]
         
@@ -80,85 +165,90 @@ class EmmetParser:
 
     def _split_by_comma(self, text: str) -> List[str]:
         """Split text by comma, respecting parentheses and brackets."""
+        if ',' not in text:
+            return [text] if text else []
+        
+        # Only brackets and commas affect the split, so visit just those
         parts = []
-        current = ""
+        start = 0
         depth = 0
         
-        for char in text:
-            if char in '([{':
+        for match in _SPLIT_TOKEN_RE.finditer(text):
+            char = match.group()
+            if char == ',':
+                if depth == 0:
+                    parts.append(text[start:match.start()])
+                    start = match.end()
+            elif char in _OPEN_BRACKETS:
                 depth += 1
-            elif char in ')]}':
+            else:
                 depth -= 1
-            elif char == ',' and depth == 0:
-                parts.append(current)
-                current = ""
-                continue
-            current += char
         
-        if current:
-            parts.append(current)
+        if start < len(text):
+            parts.append(text[start:])
         
         return parts
 
     def _parse_single_expression(self, expr: str) -> Optional[EmmetNode]:
         """Parse a single Emmet expression."""
+        return self._parse_tokens(_tokenize(expr))
+
+    def _parse_tokens(self, tokens: List[Tuple[str, str]]) -> Optional[EmmetNode]:
+        """Parse a token stream produced by _tokenize."""
         # Handle multiplication
-        multiply_match = re.search(r'\*(\d+)$', expr)
         repeat = 1
-        if multiply_match:
-            repeat = int(multiply_match.group(1))
-            expr = expr[:multiply_match.start()]
+        if tokens and tokens[-1][0] == '*':
+            repeat = int(tokens[-1][1])
+            tokens = tokens[:-1]
         
         # Handle climb-up
         climb_up = 0
-        while expr.endswith('^'):
+        while tokens and tokens[-1][0] == '^':
             climb_up += 1
-            expr = expr[:-1]
+            tokens = tokens[:-1]
+        
+        kinds = [kind for kind, _ in tokens]
         
         # Handle grouping
-        if '(' in expr and ')' in expr:
-            return self._parse_grouped_expression(expr, repeat, climb_up)
+        if '(' in kinds and ')' in kinds:
+            return self._parse_grouped_expression(tokens, kinds)
         
         # Handle child operator
-        if '>' in expr:
-            return self._parse_child_expression(expr, repeat, climb_up)
+        if '>' in kinds:
+            split = kinds.index('>')
+            return self._parse_child_expression(tokens[:split], tokens[split + 1:], repeat, climb_up)
         
-        # Handle sibling operator
-        if '+' in expr:
-            return self._parse_sibling_expression(expr, repeat, climb_up)
+        # Handle sibling operator; only the first element is kept for now
+        if '+' in kinds:
+            return self._parse_element(tokens[:kinds.index('+')], repeat, climb_up)
         
         # Parse single element
-        return self._parse_element(expr, repeat, climb_up)
+        return self._parse_element(tokens, repeat, climb_up)
 
-    def _parse_element(self, expr: str, repeat: int = 1, climb_up: int = 0) -> Optional[EmmetNode]:
+    def _parse_element(self, tokens: List[Tuple[str, str]], repeat: int = 1, climb_up: int = 0) -> EmmetNode:
         """Parse a single element."""
-        # Extract tag name
-        tag_match = re.match(r'^([a-zA-Z0-9-]+)', expr)
-        tag = tag_match.group(1) if tag_match else 'div'
-        
-        # Extract ID
-        id_match = re.search(r'#([a-zA-Z0-9-_]+)', expr)
-        element_id = id_match.group(1) if id_match else None
-        
-        # Extract classes
-        class_matches = re.findall(r'\.([a-zA-Z0-9-_]+)', expr)
-        classes = class_matches
-        
-        # Extract attributes
+        tag = sys.intern(tokens[0][1]) if tokens and tokens[0][0] == 'TAG' else 'div'
+        element_id = None
+        classes = []
         attributes = {}
-        attr_matches = re.findall(r'\[([^\]]+)\]', expr)
-        for attr_str in attr_matches:
-            if '=' in attr_str:
-                key, value = attr_str.split('=', 1)
-                # Remove quotes if present
-                value = value.strip('"\'')
-                attributes[key.strip()] = value
-            else:
-                attributes[attr_str.strip()] = ""
-        
-        # Extract content
-        content_match = re.search(r'\{([^}]*)\}', expr)
-        content = content_match.group(1) if content_match else None
+        content = None
+        
+        for kind, value in tokens:
+            if kind == 'CLASS':
+                classes.append(value)
+            elif kind == 'ID':
+                if element_id is None:
+                    element_id = value
+            elif kind == 'ATTR':
+                if '=' in value:
+                    key, attr_value = value.split('=', 1)
+                    # Remove quotes if present
+                    attributes[key.strip()] = attr_value.strip('"\'')
+                else:
+                    attributes[value.strip()] = ""
+            elif kind == 'CONTENT':
+                if content is None:
+                    content = value
         
         return EmmetNode(
             tag=tag,
@@ -168,20 +258,16 @@ class EmmetParser:
             content=content,
             children=[],
             repeat=repeat,
-            climb_up=climb_up
+            climb_up=climb_up,
+            classes_joined=' '.join(classes) if classes else None
         )
 
-    def _parse_child_expression(self, expr: str, repeat: int = 1, climb_up: int = 0) -> Optional[EmmetNode]:
+    def _parse_child_expression(self, parent_tokens: List[Tuple[str, str]], child_tokens: List[Tuple[str, str]],
+                                repeat: int = 1, climb_up: int = 0) -> Optional[EmmetNode]:
         """Parse expression with child operator (>)."""
-        parts = expr.split('>', 1)
-        if len(parts) != 2:
-            return None
+        parent = self._parse_element(parent_tokens)
         
-        parent = self._parse_element(parts[0].strip())
-        if not parent:
-            return None
-        
-        child = self._parse_single_expression(parts[1].strip())
+        child = self._parse_tokens(child_tokens)
         if child:
             parent.children.append(child)
         
@@ -189,26 +275,20 @@ class EmmetParser:
         parent.climb_up = climb_up
         return parent
 
-    def _parse_sibling_expression(self, expr: str, repeat: int = 1, climb_up: int = 0) -> Optional[EmmetNode]:
-        """Parse expression with sibling operator (+)."""
-        parts = expr.split('+', 1)
-        if len(parts) != 2:
-            return None
-        
-        # For simplicity, return the first element
-        # In a full implementation, you'd want to handle siblings properly
-        return self._parse_element(parts[0].strip(), repeat, climb_up)
-
-    def _parse_grouped_expression(self, expr: str, repeat: int = 1, climb_up: int = 0) -> Optional[EmmetNode]:
+    def _parse_grouped_expression(self, tokens: List[Tuple[str, str]], kinds: List[str]) -> Optional[EmmetNode]:
         """Parse grouped expression with parentheses."""
         # This is a simplified implementation
         # A full parser would handle nested groups properly
-        group_match = re.search(r'\(([^)]+)\)', expr)
-        if not group_match:
-            return None
-        
-        group_content = group_match.group(1)
-        return self._parse_single_expression(group_content)
+        start = -1
+        for index, kind in enumerate(kinds):
+            if kind == '(' and start == -1:
+                start = index
+            elif kind == ')' and start != -1:
+                if index > start + 1:
+                    return self._parse_tokens(tokens[start + 1:index])
+                start = -1
+        
+        return None
 
 
 class EmmetExpander:
@@ -218,19 +298,34 @@ class EmmetExpander:
         self.parser = EmmetParser()
         self.tab_stops = []
         self.current_tab_stop = 1
+        
+        # Tag names in sorted order, so the tags under a prefix are one
+        # bisected run
+        self._sorted_tags = tuple(sorted(self.parser.html5_tags))
+        
+        # The pattern expansions don't depend on the prefix, so expand them once
+        self._pattern_completions: List[Dict[str, str]] = [
+            self._make_pattern_entry(pattern, description) for pattern, description in _EMMET_PATTERNS
+        ]
 
     def expand(self, abbreviation: str, with_jinja: bool = False) -> str:
         """Expand an Emmet abbreviation to HTML."""
-        nodes = self.parser.parse(abbreviation)
-        if not nodes:
-            return ""
-        
-        self.tab_stops = []
-        self.current_tab_stop = 1
-        
-        result = ""
-        for node in nodes:
-            result += self._expand_node(node, with_jinja)
+        # Snippets are fixed text, so skip building and walking a node for them
+        snippet = self.parser.snippets.get(abbreviation)
+        if snippet is not None:
+            result = snippet
+        else:
+            nodes = self.parser.parse(abbreviation)
+            if not nodes:
+                return ""
+            
+            self.tab_stops = []
+            self.current_tab_stop = 1
+            
+            parts: List[str] = []
+            for node in nodes:
+                self._expand_node(node, with_jinja, 0, parts)
+            result = ''.join(parts)
         
         # Add final tab stop
         if '$0' not in result:
@@ -238,12 +333,12 @@ class EmmetExpander:
         
         return result
 
-    def _expand_node(self, node: EmmetNode, with_jinja: bool = False, indent: int = 0) -> str:
-        """Expand a single node to HTML."""
+    def _expand_node(self, node: EmmetNode, with_jinja: bool, indent: int, out: List[str]):
+        """Expand a single node to HTML, appending the pieces to out."""
         if node.tag == 'snippet':
-            return node.content
+            out.append(node.content)
+            return
         
-        result = ""
         indent_str = "    " * indent
         
         for i in range(node.repeat):
@@ -251,53 +346,49 @@ class EmmetExpander:
             multiplier_suffix = f"{i + 1}" if node.repeat > 1 else ""
             
             # Start tag
-            tag_str = self._build_start_tag(node, multiplier_suffix, with_jinja)
+            out.append(indent_str)
+            self._build_start_tag(node, multiplier_suffix, with_jinja, out)
             
             if node.tag in self.parser.void_elements:
-                result += f"{indent_str}{tag_str}\n"
+                out.append("\n")
             else:
-                result += f"{indent_str}{tag_str}"
-                
                 # Content or tab stop
                 if node.content:
                     content = node.content
                     if multiplier_suffix:
                         content = content.replace('$', f'${multiplier_suffix}')
-                    result += content
+                    out.append(content)
                 elif not node.children:
-                    result += f"${self.current_tab_stop}"
+                    out.append(f"${self.current_tab_stop}")
                     self.current_tab_stop += 1
                 
                 # Children
                 if node.children:
-                    result += "\n"
+                    out.append("\n")
                     for child in node.children:
-                        result += self._expand_node(child, with_jinja, indent + 1)
-                    result += indent_str
+                        self._expand_node(child, with_jinja, indent + 1, out)
+                    out.append(indent_str)
                 
                 # End tag
-                result += f"</{node.tag}>"
+                out.append(f"</{node.tag}>")
                 
                 if i < node.repeat - 1 or indent > 0:
-                    result += "\n"
-        
-        return result
+                    out.append("\n")
 
-    def _build_start_tag(self, node: EmmetNode, multiplier_suffix: str = "", with_jinja: bool = False) -> str:
-        """Build the opening tag with attributes."""
-        tag = f"<{node.tag}"
+    def _build_start_tag(self, node: EmmetNode, multiplier_suffix: str, with_jinja: bool, out: List[str]):
+        """Build the opening tag with attributes, appending the pieces to out."""
+        out.append(f"<{node.tag}")
         
         # ID attribute
         if node.id:
             id_value = node.id
             if multiplier_suffix:
                 id_value += multiplier_suffix
-            tag += f' id="{id_value}"'
+            out.append(f' id="{id_value}"')
         
         # Class attribute
-        if node.classes:
-            classes_str = " ".join(node.classes)
-            tag += f' class="{classes_str}"'
+        if node.classes_joined:
+            out.append(f' class="{node.classes_joined}"')
         
         # Other attributes
         for key, value in node.attributes.items():
@@ -305,59 +396,52 @@ class EmmetExpander:
                 attr_value = value
                 if multiplier_suffix and '$' in value:
                     attr_value = value.replace('$', multiplier_suffix)
-                tag += f' {key}="{attr_value}"'
+                out.append(f' {key}="{attr_value}"')
             else:
-                tag += f' {key}'
+                out.append(f' {key}')
         
         # Add common Jinja2 attributes if requested
-        if with_jinja and node.tag in ['input', 'select', 'textarea', 'form']:
+        if with_jinja and node.tag in _FORM_TAGS:
             if node.tag == 'form' and 'method' not in node.attributes:
-                tag += ' method="post"'
+                out.append(' method="post"')
         
-        tag += ">"
-        return tag
+        out.append(">")
 
     def get_completions(self, prefix: str) -> List[Dict[str, str]]:
         """Get Emmet completion suggestions for a prefix."""
         completions = []
+        lowered = prefix.lower()
         
         # Tag completions
-        for tag in self.parser.html5_tags:
-            if tag.startswith(prefix.lower()):
-                completions.append({
-                    'label': tag,
-                    'kind': 'Keyword',
-                    'detail': 'HTML tag',
-                    'insert_text': f'{tag}>$1</{tag}>$0' if tag not in self.parser.void_elements else f'{tag}>',
-                    'documentation': f'HTML <{tag}> element'
-                })
+        tags = self._sorted_tags
+        start = bisect.bisect_left(tags, lowered)
+        end = bisect.bisect_left(tags, lowered + '\U0010ffff', start)
+        for tag in tags[start:end]:
+            completions.append({
+                'label': tag,
+                'label_lc': tag,
+                'kind': 'Keyword',
+                'detail': 'HTML tag',
+                'insert_text': f'{tag}>$1</{tag}>$0' if tag not in self.parser.void_elements else f'{tag}>',
+                'documentation': f'HTML <{tag}> element'
+            })
         
         # Emmet abbreviation completions
-        emmet_patterns = [
-            ('div.class', 'div with class'),
-            ('div#id', 'div with ID'),
-            ('ul>li*3', 'unordered list with 3 items'),
-            ('table>tr>td*3', 'table with row and 3 cells'),
-            ('form>input[type=text]+input[type=submit]', 'form with text input and submit button'),
-            ('nav>ul>li*5>a', 'navigation with 5 menu items'),
-            ('header+main+footer', 'page structure'),
-            ('article>h1+p*3', 'article with heading and paragraphs'),
-            ('section.container>div.row>div.col*3', 'grid layout'),
-            ('img[src alt]', 'image with attributes'),
-        ]
-        
-        for pattern, description in emmet_patterns:
-            if pattern.startswith(prefix.lower()) or prefix.lower() in pattern:
-                expanded = self.expand(pattern)
-                completions.append({
-                    'label': pattern,
-                    'kind': 'Snippet',
-                    'detail': description,
-                    'insert_text': expanded,
-                    'documentation': f'Emmet: {pattern}\n\nExpands to:\n{expanded[:200]}...' if len(expanded) > 200 else f'Emmet: {pattern}\n\nExpands to:\n{expanded}'
-                })
+        completions.extend([entry for entry in self._pattern_completions if lowered in entry['label']])
         
         return completions
+    
+    def _make_pattern_entry(self, pattern: str, description: str) -> Dict[str, str]:
+        """Expand an Emmet pattern into its completion entry."""
+        expanded = self.expand(pattern)
+        return {
+            'label': pattern,
+            'label_lc': pattern.lower(),
+            'kind': 'Snippet',
+            'detail': description,
+            'insert_text': expanded,
+            'documentation': f'Emmet: {pattern}\n\nExpands to:\n{expanded[:200]}...' if len(expanded) > 200 else f'Emmet: {pattern}\n\nExpands to:\n{expanded}'
+        }
 
 
 class JinjaEmmetIntegration:
@@ -384,11 +468,21 @@ class JinjaEmmetIntegration:
             'url': '{{ url_for("$1") }}$0',
             'csrf': '<input type="hidden" name="csrf_token" value="{{ csrf_token() }}"/>$0',
         }
+        
+        # Jinja2 enhanced patterns, looked up by the name after 'j:'
+        self.jinja_patterns = {
+            'form': '<form method="post">\n    {{ csrf_token() }}\n    $1\n    <input type="submit" value="$2">\n</form>$0',
+            'table': '{% for item in $1 %}\n<tr>\n    <td>{{ item.$2 }}</td>\n</tr>\n{% endfor %}$0',
+            'list': '{% for item in $1 %}\n<li>{{ item }}</li>\n{% endfor %}$0',
+            'select': '<select name="$1">\n{% for option in $2 %}\n    <option value="{{ option.value }}">{{ option.label }}</option>\n{% endfor %}\n</select>$0',
+            'if-form': '{% if form.$1.errors %}\n    <div class="error">{{ form.$1.errors[0] }}</div>\n{% endif %}\n{{ form.$1 }}$0',
+        }
     
     def expand_with_jinja_context(self, abbreviation: str, context: Dict[str, str] = None) -> str:
         """Expand Emmet abbreviation with Jinja2 context awareness."""
-        if abbreviation in self.jinja_snippets:
-            return self.jinja_snippets[abbreviation]
+        snippet = self.jinja_snippets.get(abbreviation)
+        if snippet is not None:
+            return snippet
         
         # Check for Jinja2 enhanced patterns
         if abbreviation.startswith('j:'):
@@ -399,25 +493,19 @@ class JinjaEmmetIntegration:
     
     def _expand_jinja_pattern(self, pattern: str, context: Dict[str, str]) -> str:
         """Expand Jinja2-specific patterns."""
-        jinja_patterns = {
-            'form': '<form method="post">\n    {{ csrf_token() }}\n    $1\n    <input type="submit" value="$2">\n</form>$0',
-            'table': '{% for item in $1 %}\n<tr>\n    <td>{{ item.$2 }}</td>\n</tr>\n{% endfor %}$0',
-            'list': '{% for item in $1 %}\n<li>{{ item }}</li>\n{% endfor %}$0',
-            'select': '<select name="$1">\n{% for option in $2 %}\n    <option value="{{ option.value }}">{{ option.label }}</option>\n{% endfor %}\n</select>$0',
-            'if-form': '{% if form.$1.errors %}\n    <div class="error">{{ form.$1.errors[0] }}</div>\n{% endif %}\n{{ form.$1 }}$0',
-        }
-        
-        return jinja_patterns.get(pattern, pattern)
+        return self.jinja_patterns.get(pattern, pattern)
     
     def get_jinja_completions(self, prefix: str) -> List[Dict[str, str]]:
         """Get Jinja2-aware completions."""
         completions = []
+        lowered = prefix.lower()
         
         # Jinja2 snippet completions
         for snippet_key, snippet_value in self.jinja_snippets.items():
-            if snippet_key.startswith(prefix.lower()):
+            if snippet_key.startswith(lowered):
                 completions.append({
                     'label': snippet_key,
+                    'label_lc': snippet_key,
                     'kind': 'Snippet',
                     'detail': 'Jinja2 snippet',
                     'insert_text': snippet_value,
@@ -429,19 +517,12 @@ class JinjaEmmetIntegration:
         
         # Add Jinja2 enhanced patterns
         if prefix.startswith('j:'):
-            jinja_patterns = [
-                ('j:form', 'Jinja2 form with CSRF'),
-                ('j:table', 'Jinja2 table iteration'),
-                ('j:list', 'Jinja2 list iteration'),
-                ('j:select', 'Jinja2 select with options'),
-                ('j:if-form', 'Jinja2 form field with error handling'),
-            ]
-            
-            for pattern, description in jinja_patterns:
-                if pattern.startswith(prefix.lower()):
+            for pattern, description in _JINJA_PATTERNS:
+                if pattern.startswith(lowered):
                     expanded = self.expand_with_jinja_context(pattern)
                     completions.append({
                         'label': pattern,
+                        'label_lc': pattern,
                         'kind': 'Snippet',
                         'detail': description,
                         'insert_text': expanded,
@@ -6,13 +6,19 @@ A language server for Jinja2 HTML templates with auto-completion, diagnostics, a
 
 import asyncio
 import logging
+import queue
 import sys
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Iterator, Tuple, Union
 import re
 import json
+from array import array
+from functools import cached_property, lru_cache
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from threading import Event
 
-from pygls.server import LanguageServer
+from pygls.server import LanguageServer, StdOutTransportAdapter
 from pygls.workspace import Document
 from lsprotocol.types import (
     CompletionItem,
@@ -22,6 +28,7 @@ from lsprotocol.types import (
     Diagnostic,
     DiagnosticSeverity,
     DidChangeTextDocumentParams,
+    DidCloseTextDocumentParams,
     DidOpenTextDocumentParams,
     HoverParams,
     Hover,
@@ -44,88 +51,367 @@ except ImportError:
     from emmet_support import emmet_integration
 
 # Configure logging
+_log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_log_handlers = [
+    logging.FileHandler('jinja2-html-lsp.log'),
+    logging.StreamHandler(sys.stderr)
+]
+for _handler in _log_handlers:
+    _handler.setFormatter(_log_formatter)
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('jinja2-html-lsp.log'),
-        logging.StreamHandler(sys.stderr)
-    ]
+    handlers=_log_handlers
 )
 
+# While the server runs, handlers only enqueue records and a background
+# thread writes them, so request handlers never wait on file or pipe I/O.
+# The queue handler only merges the message; the writers apply the layout
+_log_queue = queue.SimpleQueue()
+_queue_handler = QueueHandler(_log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+_log_listener = QueueListener(_log_queue, *_log_handlers)
+
 logger = logging.getLogger(__name__)
 
+# pygls logs the full JSON body of every message it sends at INFO, which
+# would write each completion list to the log file and stderr again
+logging.getLogger('pygls').setLevel(logging.WARNING)
+
+# Tag patterns for validation, compiled once at import
+_OPEN_TAG_RE = re.compile(r'<([a-zA-Z]+)')
+_CLOSE_TAG_RE = re.compile(r'</([a-zA-Z]+)')
+
+# Line boundaries as recognized by str.splitlines(), which pygls uses for Document.lines
+_LINE_BREAK_RE = re.compile('\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
+
+# Runs of alphanumeric characters, the words hover looks up
+_HOVER_WORD_RE = re.compile(r'[^\W_]+')
+
+# HTML5 void elements, which never have a closing tag
+_VOID_TAGS = frozenset({
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+})
+
+# Seconds of editing quiet before a changed document is revalidated
+_VALIDATION_DELAY = 0.15
+
+# Documents with at least this many lines are validated on a worker thread
+_BACKGROUND_VALIDATION_LINES = 500
+
+# Identical diagnostics are resent after this many skipped publishes, in
+# case the client missed one
+_REPUBLISH_INTERVAL = 10
+
+# Most diagnostics published for one document; past this the rest of a
+# generated or minified template would only flood the client
+_MAX_DIAGNOSTICS = 1000
+
+# Most completion results kept per document version
+_COMPLETION_CACHE_SIZE = 256
+
+# Most bytes taken from stdin per read
+_READ_CHUNK_SIZE = 65536
+
+def _word_at(line: str, character: int) -> str:
+    """Return the alphanumeric word touching the given column, or ''."""
+    for match in _HOVER_WORD_RE.finditer(line):
+        if match.end() >= character:
+            return match.group() if match.start() <= character else ''
+    return ''
+
+
+async def _read_chunks(loop, executor, stop_event: Event, rfile, proxy):
+    """Pass stdin to the protocol in chunks of whatever has arrived."""
+    # One executor round trip per chunk, however many messages it holds,
+    # instead of one per header line and body; the protocol buffers
+    # messages split across chunks
+    while not stop_event.is_set() and not rfile.closed:
+        data = await loop.run_in_executor(executor, rfile.read1, _READ_CHUNK_SIZE)
+        if not data:
+            break
+        proxy(data)
+
+
+# Diagnostics are never mutated after construction, so a finding that stays
+# on the same line across validations reuses one object
+@lru_cache(maxsize=4096)
+def _make_diagnostic(line: int, start: int, end: int, message: str,
+                     severity: DiagnosticSeverity) -> Diagnostic:
+    """Return the diagnostic for a finding on the given line."""
+    return Diagnostic(
+        range=Range(
+            start=Position(line=line, character=start),
+            end=Position(line=line, character=end)
+        ),
+        message=message,
+        severity=severity
+    )
+
+
 class Jinja2HTMLLanguageServer(LanguageServer):
     """Language server for Jinja2 HTML templates."""
     
     def __init__(self):
         super().__init__("jinja2-html-lsp", "0.1.0")
         
-        # Initialize completion provider
-        self.completion_provider = Jinja2HTMLCompletionProvider()
-        
         # Initialize emmet integration
         self.emmet = emmet_integration
         
         # Cache for document analysis
         self._document_cache = {}
+        
+        # Completion results for the current source of each document, by
+        # (line text, column), so repeated requests skip the provider
+        self._completion_cache: Dict[str, Tuple[str, Dict[Tuple[str, int], Tuple[CompletionItem, ...]]]] = {}
+        
+        # Start offset of every line in the current source of each document
+        self._line_starts: Dict[str, Tuple[str, array]] = {}
+        
+        # Diagnostics last sent for each document, with the number of
+        # identical publishes skipped since
+        self._published_diagnostics: Dict[str, Tuple[List[Diagnostic], int]] = {}
+        
+        # Debounced validation tasks waiting to run, by document URI
+        self._pending_validations: Dict[str, asyncio.Task] = {}
+        
+        # Source each document's published diagnostics were computed from
+        self._validated_sources: Dict[str, str] = {}
+
+    def start_io(self, stdin: Optional[Any] = None, stdout: Optional[Any] = None):
+        """Start the IO server, reading stdin in chunks rather than line by line."""
+        logger.info("Starting IO server")
+        
+        self._stop_event = Event()
+        rfile = stdin or sys.stdin.buffer
+        transport = StdOutTransportAdapter(rfile, stdout or sys.stdout.buffer)
+        self.lsp.connection_made(transport)
+        
+        try:
+            self.loop.run_until_complete(
+                _read_chunks(self.loop, self.thread_pool_executor, self._stop_event, rfile, self.lsp.data_received)
+            )
+        except BrokenPipeError:
+            logger.error("Connection to the client is lost! Shutting down the server.")
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            self.shutdown()
+
+    @cached_property
+    def completion_provider(self) -> Jinja2HTMLCompletionProvider:
+        """Completion provider, built on first use so startup stays fast."""
+        return Jinja2HTMLCompletionProvider()
+
+    @cached_property
+    def hover_index(self) -> Dict[str, str]:
+        """Hover Markdown for every known word, rendered once on first use."""
+        return self._build_hover_index()
+
+    def _build_hover_index(self) -> Dict[str, str]:
+        """Render the hover text of every filter, function, keyword and tag."""
+        provider = self.completion_provider
+        index = {}
+        
+        # Earlier tables win when a word appears in several
+        for word, info in provider.jinja2_filters.items():
+            args_info = f"\n\n**Arguments:** {', '.join(info['args'])}" if 'args' in info else ""
+            index.setdefault(word, f"**Jinja2 Filter: {word}**\n\n{info['description']}{args_info}")
+        
+        for word, info in provider.jinja2_functions.items():
+            args_info = f"\n\n**Arguments:** {', '.join(info['args'])}" if 'args' in info else ""
+            index.setdefault(word, f"**Jinja2 Function: {word}**\n\n{info['description']}{args_info}")
+        
+        for word, info in provider.jinja2_keywords.items():
+            index.setdefault(word, f"**Jinja2 Keyword: {word}**\n\n{info['description']}")
+        
+        for word, info in provider.html_tags.items():
+            attrs_info = f"\n\n**Common attributes:** {', '.join(info['attributes'])}" if 'attributes' in info else ""
+            description = info.get('description', f'HTML {word} element')
+            index.setdefault(word, f"**HTML Element: <{word}>**\n\n{description}{attrs_info}")
+        
+        return index
+
+    def get_line(self, document: Document, line_number: int) -> str:
+        """Return a line of the document, as in document.lines, without splitting the whole source."""
+        source = document.source
+        cached = self._line_starts.get(document.uri)
+        if cached is None or cached[0] != source:
+            starts = array('i', [0])
+            starts.extend(match.end() for match in _LINE_BREAK_RE.finditer(source))
+            cached = (source, starts)
+            self._line_starts[document.uri] = cached
+        
+        starts = cached[1]
+        end = starts[line_number + 1] if line_number + 1 < len(starts) else len(source)
+        return source[starts[line_number]:end]
 
     def get_completion_items(self, document: Document, position: Position) -> List[CompletionItem]:
         """Generate completion items using the enhanced completion provider."""
-        line = document.lines[position.line]
+        line = self.get_line(document, position.line)
         
-        # Analyze completion context
-        request = self.completion_provider.analyze_completion_context(line, position.character)
+        # Per the LSP spec, a character past the end of the line means the end
+        character = min(position.character, len(line.rstrip('\r\n')))
         
-        # Get completions from the provider
-        completions = self.completion_provider.provide_completions(request, document.source)
+        # Results stay valid until the document changes
+        cached = self._completion_cache.get(document.uri)
+        if cached is None or cached[0] != document.source:
+            cached = (document.source, {})
+            self._completion_cache[document.uri] = cached
+        results = cached[1]
         
-        return completions
+        key = (line, character)
+        completions = results.get(key)
+        if completions is None:
+            if len(results) >= _COMPLETION_CACHE_SIZE:
+                results.clear()
+            
+            # Analyze completion context
+            request = self.completion_provider.analyze_completion_context(line, character)
+            
+            # Get completions from the provider
+            completions = tuple(self.completion_provider.provide_completions(request, document.source, document.uri))
+            results[key] = completions
+        
+        return list(completions)
+
+    def schedule_validation(self, uri: str, delay: float = _VALIDATION_DELAY):
+        """Validate a document once edits pause, replacing any pending validation."""
+        self.cancel_validation(uri)
+        self._pending_validations[uri] = asyncio.get_running_loop().create_task(
+            self._debounced_validate(uri, delay)
+        )
+
+    def cancel_validation(self, uri: str):
+        """Drop the pending validation of a document, if any."""
+        pending = self._pending_validations.pop(uri, None)
+        if pending is not None:
+            pending.cancel()
+
+    def forget_document(self, uri: str):
+        """Drop the pending validation and everything cached for a closed document."""
+        self.cancel_validation(uri)
+        self._document_cache.pop(uri, None)
+        self._completion_cache.pop(uri, None)
+        self._line_starts.pop(uri, None)
+        self._published_diagnostics.pop(uri, None)
+        self._validated_sources.pop(uri, None)
+        self.completion_provider.remove_document_index(uri)
+
+    async def _debounced_validate(self, uri: str, delay: float):
+        """Wait out the delay, then publish diagnostics for the document."""
+        await asyncio.sleep(delay)
+        document = self.workspace.get_document(uri)
+        source = document.source
+        
+        # Large documents are validated off the event loop so requests keep
+        # being served meanwhile
+        if source.count('\n') >= _BACKGROUND_VALIDATION_LINES:
+            loop = asyncio.get_running_loop()
+            diagnostics, findings_by_line = await loop.run_in_executor(None, self._collect_diagnostics, document)
+        else:
+            diagnostics, findings_by_line = self._collect_diagnostics(document)
+        
+        # Results are installed here on the event loop, and only while this is
+        # still the document's pending validation, so a worker that outlives
+        # an edit or a close can't put back a stale cache entry
+        if self._pending_validations.get(uri) is not asyncio.current_task():
+            return
+        del self._pending_validations[uri]
+        self._document_cache[uri] = findings_by_line
+        self._validated_sources[uri] = source
+        self.publish_if_changed(uri, diagnostics)
+
+    def validate_and_publish(self, document: Document):
+        """Validate the document now and publish its diagnostics."""
+        source = document.source
+        diagnostics = self.validate_document(document)
+        self._validated_sources[document.uri] = source
+        self.publish_if_changed(document.uri, diagnostics)
+
+    def is_validated(self, document: Document) -> bool:
+        """Whether the diagnostics last published for the document match its source."""
+        return self._validated_sources.get(document.uri) == document.source
+
+    def publish_if_changed(self, uri: str, diagnostics: List[Diagnostic]):
+        """Publish diagnostics unless they match what the client already has."""
+        published = self._published_diagnostics.get(uri)
+        if published is not None and published[0] == diagnostics and published[1] < _REPUBLISH_INTERVAL:
+            self._published_diagnostics[uri] = (published[0], published[1] + 1)
+            return
+        
+        self._published_diagnostics[uri] = (diagnostics, 0)
+        self.publish_diagnostics(uri, diagnostics)
 
     def validate_document(self, document: Document) -> List[Diagnostic]:
         """Validate the document and return diagnostics."""
-        diagnostics = []
-        lines = document.lines
-        
-        for line_num, line in enumerate(lines):
-            # Check for unclosed Jinja2 blocks
-            if '{{' in line and '}}' not in line:
-                diagnostics.append(Diagnostic(
-                    range=Range(
-                        start=Position(line=line_num, character=line.find('{{')),
-                        end=Position(line=line_num, character=len(line))
-                    ),
-                    message="Unclosed Jinja2 expression",
-                    severity=DiagnosticSeverity.Error
-                ))
+        diagnostics, findings_by_line = self._collect_diagnostics(document)
+        self._document_cache[document.uri] = findings_by_line
+        return diagnostics
+
+    def _collect_diagnostics(self, document: Document) -> Tuple[List[Diagnostic], Dict[str, tuple]]:
+        """Validate the document without touching the cache, returning the findings by line too."""
+        findings_by_line = {}
+        diagnostics = list(islice(self._iter_diagnostics(document, findings_by_line), _MAX_DIAGNOSTICS))
+        return diagnostics, findings_by_line
+
+    def _iter_diagnostics(self, document: Document, findings_by_line: Dict[str, tuple]) -> Iterator[Diagnostic]:
+        """Yield the diagnostics of the document line by line, recording findings_by_line."""
+        # Reuse the findings of lines seen in the last validation, keyed by
+        # line text so that inserted or deleted lines don't invalidate the
+        # rest; the caller owns findings_by_line since it may stop early
+        previous = self._document_cache.get(document.uri, {})
+        
+        for line_num, line in enumerate(document.source.splitlines()):
+            # Lines without a delimiter can't have findings; skip the lookups
+            if '{' not in line and '<' not in line:
+                continue
             
-            if '{%' in line and '%}' not in line:
-                diagnostics.append(Diagnostic(
-                    range=Range(
-                        start=Position(line=line_num, character=line.find('{%')),
-                        end=Position(line=line_num, character=len(line))
-                    ),
-                    message="Unclosed Jinja2 statement",
-                    severity=DiagnosticSeverity.Error
-                ))
+            findings = findings_by_line.get(line)
+            if findings is None:
+                findings = previous.get(line)
+                if findings is None:
+                    findings = self._validate_line(line)
+                findings_by_line[line] = findings
             
-            # Check for unclosed HTML tags (basic check)
-            open_tags = re.findall(r'<([a-zA-Z]+)', line)
-            close_tags = re.findall(r'</([a-zA-Z]+)', line)
+            for start, end, message, severity in findings:
+                yield _make_diagnostic(line_num, start, end, message, severity)
+
+    # Kept in pure Python: each line costs a few C-level substring searches
+    # and regex calls, and findings are cached by line text, so a compiled
+    # scanner would save little and need a build toolchain at install time
+    @staticmethod
+    def _validate_line(line: str) -> Tuple[Tuple[int, int, str, DiagnosticSeverity], ...]:
+        """Find the problems on one line as (start, end, message, severity)."""
+        findings = []
+        
+        # Check for unclosed Jinja2 blocks; only lines with a '{' can have one.
+        # These substring checks are memchr-fast and beat a single
+        # overlapping-delimiter regex over the line several times over
+        if '{' in line:
+            expression_start = line.find('{{')
+            if expression_start != -1 and '}}' not in line:
+                findings.append((expression_start, len(line), "Unclosed Jinja2 expression", DiagnosticSeverity.Error))
             
-            for tag in open_tags:
-                if tag not in ['br', 'hr', 'img', 'input', 'meta', 'link']:  # Self-closing tags
-                    if tag not in close_tags:
-                        diagnostics.append(Diagnostic(
-                            range=Range(
-                                start=Position(line=line_num, character=line.find(f'<{tag}')),
-                                end=Position(line=line_num, character=line.find(f'<{tag}') + len(tag) + 1)
-                            ),
-                            message=f"Unclosed HTML tag: {tag}",
-                            severity=DiagnosticSeverity.Warning
-                        ))
+            statement_start = line.find('{%')
+            if statement_start != -1 and '%}' not in line:
+                findings.append((statement_start, len(line), "Unclosed Jinja2 statement", DiagnosticSeverity.Error))
         
-        return diagnostics
+        # Check for unclosed HTML tags (basic check); close tags only
+        # matter on lines that open one
+        if '<' in line:
+            open_tags = list(_OPEN_TAG_RE.finditer(line))
+            if open_tags:
+                close_tags = set(_CLOSE_TAG_RE.findall(line))
+                
+                for match in open_tags:
+                    tag = match.group(1)
+                    if tag not in _VOID_TAGS and tag not in close_tags:
+                        findings.append((match.start(), match.end(), f"Unclosed HTML tag: {tag}",
+                                         DiagnosticSeverity.Warning))
+        
+        return tuple(findings)
 
 
 # Create the language server instance
@@ -146,93 +432,69 @@ def completion(params: CompletionParams) -> CompletionList:
 def hover(params: HoverParams) -> Optional[Hover]:
     """Provide hover information."""
     document = server.workspace.get_document(params.text_document.uri)
-    line = document.lines[params.position.line]
+    line = server.get_line(document, params.position.line)
     
     # Get word at position
-    word_start = params.position.character
-    word_end = params.position.character
-    
-    while word_start > 0 and line[word_start - 1].isalnum():
-        word_start -= 1
-    while word_end < len(line) and line[word_end].isalnum():
-        word_end += 1
-    
-    word = line[word_start:word_end]
-    
-    # Check Jinja2 filters
-    filter_info = server.completion_provider.jinja2_filters.get(word)
-    if filter_info:
-        args_info = ""
-        if 'args' in filter_info:
-            args_info = f"\n\n**Arguments:** {', '.join(filter_info['args'])}"
-        
-        return Hover(
-            contents=MarkupContent(
-                kind=MarkupKind.Markdown,
-                value=f"**Jinja2 Filter: {word}**\n\n{filter_info['description']}{args_info}"
-            )
-        )
+    word = _word_at(line, params.position.character)
     
-    # Check Jinja2 functions
-    func_info = server.completion_provider.jinja2_functions.get(word)
-    if func_info:
-        args_info = ""
-        if 'args' in func_info:
-            args_info = f"\n\n**Arguments:** {', '.join(func_info['args'])}"
-        
-        return Hover(
-            contents=MarkupContent(
-                kind=MarkupKind.Markdown,
-                value=f"**Jinja2 Function: {word}**\n\n{func_info['description']}{args_info}"
-            )
-        )
+    markdown = server.hover_index.get(word)
+    if markdown is None:
+        return None
     
-    # Check Jinja2 keywords
-    keyword_info = server.completion_provider.jinja2_keywords.get(word)
-    if keyword_info:
-        return Hover(
-            contents=MarkupContent(
-                kind=MarkupKind.Markdown,
-                value=f"**Jinja2 Keyword: {word}**\n\n{keyword_info['description']}"
-            )
+    return Hover(
+        contents=MarkupContent(
+            kind=MarkupKind.Markdown,
+            value=markdown
         )
-    
-    # Check HTML tags
-    tag_info = server.completion_provider.html_tags.get(word)
-    if tag_info:
-        attrs_info = ""
-        if 'attributes' in tag_info:
-            attrs_info = f"\n\n**Common attributes:** {', '.join(tag_info['attributes'])}"
-        
-        return Hover(
-            contents=MarkupContent(
-                kind=MarkupKind.Markdown,
-                value=f"**HTML Element: <{word}>**\n\n{tag_info.get('description', f'HTML {word} element')}{attrs_info}"
-            )
-        )
-    
-    return None
+    )
 
 @server.feature("textDocument/didOpen")
 def did_open(params: DidOpenTextDocumentParams):
     """Handle document open event."""
     document = server.workspace.get_document(params.text_document.uri)
-    diagnostics = server.validate_document(document)
-    server.publish_diagnostics(params.text_document.uri, diagnostics)
+    server.completion_provider.update_document_index(document.uri, document.source)
+    if not server.is_validated(document):
+        server.validate_and_publish(document)
 
 @server.feature("textDocument/didChange")
 def did_change(params: DidChangeTextDocumentParams):
     """Handle document change event."""
     document = server.workspace.get_document(params.text_document.uri)
-    diagnostics = server.validate_document(document)
-    server.publish_diagnostics(params.text_document.uri, diagnostics)
+    server.completion_provider.update_document_index(document.uri, document.source)
+    
+    # Edits that restore the validated text (an undo, an empty change
+    # list) need no new diagnostics
+    if server.is_validated(document):
+        server.cancel_validation(params.text_document.uri)
+        return
+    
+    # Coalesce bursts of keystrokes into one validation
+    server.schedule_validation(params.text_document.uri)
+
+@server.feature("textDocument/didClose")
+def did_close(params: DidCloseTextDocumentParams):
+    """Handle document close event."""
+    server.forget_document(params.text_document.uri)
 
 def main():
     """Main entry point for the language server."""
-    logger.info("Starting Jinja2 HTML Language Server")
+    root_logger = logging.getLogger()
+    for handler in _log_handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(_queue_handler)
+    _log_listener.start()
     
-    # Start the server
-    server.start_io()
+    try:
+        logger.info("Starting Jinja2 HTML Language Server")
+        
+        # Start the server
+        server.start_io()
+    finally:
+        # Flush queued records and hand the writers back to the root logger
+        _log_listener.stop()
+        root_logger.removeHandler(_queue_handler)
+        for handler in _log_handlers:
+            root_logger.addHandler(handler)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,9 +7,11 @@ This script provides comprehensive testing for all LSP server functionality.
 import sys
 import json
 import asyncio
+import io
+import threading
 import unittest
 from pathlib import Path
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, PropertyMock, patch
 from typing import List, Dict, Any
 
 # Add server directory to path
@@ -29,7 +31,7 @@ from lsprotocol.types import (
     TextDocumentContentChangeEvent
 )
 
-from main import Jinja2HTMLLanguageServer, server
+from main import Jinja2HTMLLanguageServer, _make_diagnostic, _read_chunks, server
 from completion_provider import Jinja2HTMLCompletionProvider, CompletionContext
 from emmet_support import EmmetExpander, EmmetParser, JinjaEmmetIntegration
 
@@ -40,7 +42,11 @@ class MockDocument:
     def __init__(self, source: str, uri: str = "file:///test.html.j2"):
         self.source = source
         self.uri = uri
-        self.lines = source.split('\n')
+    
+    @property
+    def lines(self) -> List[str]:
+        """Split on access, like pygls; the server itself only reads source."""
+        return self.source.split('\n')
 
 
 class TestEmmetParser(unittest.TestCase):
@@ -101,6 +107,15 @@ class TestEmmetParser(unittest.TestCase):
         self.assertEqual(len(nodes[0].children), 1)
         self.assertEqual(nodes[0].children[0].tag, "li")
 
+    def test_bracket_contents_not_tokenized(self):
+        """Test that attribute values and content don't leak into ids or classes."""
+        nodes = self.parser.parse("img[src=test.jpg]{v1.2 #3}")
+        self.assertEqual(nodes[0].tag, "img")
+        self.assertEqual(nodes[0].attributes["src"], "test.jpg")
+        self.assertEqual(nodes[0].content, "v1.2 #3")
+        self.assertEqual(nodes[0].classes, [])
+        self.assertIsNone(nodes[0].id)
+
 
 class TestEmmetExpander(unittest.TestCase):
     """Test Emmet expansion functionality."""
@@ -207,8 +222,10 @@ class TestJinjaEmmetIntegration(unittest.TestCase):
 class TestCompletionProvider(unittest.TestCase):
     """Test completion provider functionality."""
     
-    def setUp(self):
-        self.provider = Jinja2HTMLCompletionProvider()
+    @classmethod
+    def setUpClass(cls):
+        # Building the provider's tables dominates a test, so tests share one
+        cls.provider = Jinja2HTMLCompletionProvider()
     
     def test_context_detection_html(self):
         """Test HTML context detection."""
@@ -240,6 +257,12 @@ class TestCompletionProvider(unittest.TestCase):
         request = self.provider.analyze_completion_context('<div class="', 12)
         self.assertEqual(request.context, CompletionContext.ATTRIBUTE_VALUE)
     
+    def test_inside_quotes_detection(self):
+        """Test quote state tracking before the cursor."""
+        self.assertTrue(self.provider._is_inside_quotes('<a title="it\'s', 14))
+        self.assertFalse(self.provider._is_inside_quotes('<a title="say \\"hi\\""', 21))
+        self.assertTrue(self.provider._is_inside_quotes("<a title='x", 11))
+    
     def test_html_completions(self):
         """Test HTML tag completions."""
         request = self.provider.analyze_completion_context("<di", 3)
@@ -307,13 +330,80 @@ class TestCompletionProvider(unittest.TestCase):
         ids = self.provider._extract_css_ids(template)
         expected_ids = {"header", "content"}
         self.assertTrue(expected_ids.issubset(ids))
+    
+    def test_document_index_updates(self):
+        """Test incremental CSS class/ID indexing of open documents."""
+        uri = "file:///index.html.j2"
+        self.provider.update_document_index(uri, '<div class="card main">\n<p id="intro">')
+        index = self.provider._document_indexes[uri]
+        self.assertEqual(set(index.classes), {"card", "main"})
+        self.assertEqual(set(index.ids), {"intro"})
+        
+        self.provider.update_document_index(uri, '<div class="card">\n<p id="intro">\n<a class="main">')
+        self.assertEqual(set(index.classes), {"card", "main"})
+        
+        self.provider.update_document_index(uri, '<div class="card">')
+        self.assertEqual(set(index.classes), {"card"})
+        self.assertEqual(set(index.ids), set())
+        self.assertEqual(index.class_trie.top_k("", 10), ["card"])
+        self.assertEqual(index.id_trie.top_k("", 10), [])
+        
+        self.provider.remove_document_index(uri)
+        self.assertNotIn(uri, self.provider._document_indexes)
+    
+    def test_document_index_multiline_values(self):
+        """Test that class/ID values spanning lines are indexed as a whole."""
+        uri = "file:///multiline.html.j2"
+        self.provider.update_document_index(uri, '<div class="card\n  main">\n<p id="intro">')
+        index = self.provider._document_indexes[uri]
+        self.assertEqual(set(index.classes), {"card", "main"})
+        self.assertEqual(set(index.ids), {"intro"})
+        
+        # Editing the continuation line rescans the value from its first line
+        self.provider.update_document_index(uri, '<div class="card\n  wide">\n<p id="intro">')
+        self.assertEqual(set(index.classes), {"card", "wide"})
+        
+        # Closing the value early leaves the next line on its own
+        self.provider.update_document_index(uri, '<div class="card">\n  wide">\n<p id="intro">')
+        self.assertEqual(set(index.classes), {"card"})
+        
+        # Reopening a value at the end joins the lines appended after it
+        self.provider.update_document_index(uri, '<p id="intro">\n<a class="btn')
+        self.provider.update_document_index(uri, '<p id="intro">\n<a class="btn\n btn-lg">')
+        self.assertEqual(dict(index.classes), {"btn": 1, "btn-lg": 1})
+        
+        self.provider.remove_document_index(uri)
+    
+    def test_document_class_ranking(self):
+        """Test that indexed classes are offered most used first."""
+        uri = "file:///ranked.html.j2"
+        self.provider.update_document_index(
+            uri, '<a class="btn">\n<a class="btn-lg btn">\n<a class="btn-lg">\n<a class="btn-lg">'
+        )
+        index = self.provider._document_indexes[uri]
+        self.assertEqual(index.class_trie.top_k("bt", 10), ["btn-lg", "btn"])
+        self.assertEqual(index.class_trie.top_k("bt", 1), ["btn-lg"])
+        self.assertEqual(index.class_trie.top_k("x", 10), [])
+    
+    def test_completion_limit(self):
+        """Test that max_items caps the number of completions."""
+        request = self.provider.analyze_completion_context("{{ ", 3)
+        all_items = self.provider.provide_completions(request, "")
+        limited = self.provider.provide_completions(request, "", max_items=5)
+        self.assertGreater(len(all_items), 5)
+        self.assertEqual([c.label for c in limited], [c.label for c in all_items[:5]])
 
 
 class TestLanguageServer(unittest.TestCase):
     """Test language server functionality."""
     
-    def setUp(self):
-        self.server = Jinja2HTMLLanguageServer()
+    @classmethod
+    def setUpClass(cls):
+        # Tests share one server; per-document state is dropped after each
+        cls.server = Jinja2HTMLLanguageServer()
+    
+    def tearDown(self):
+        self.server.forget_document("file:///test.html.j2")
     
     def test_server_initialization(self):
         """Test server initialization."""
@@ -328,6 +418,25 @@ class TestLanguageServer(unittest.TestCase):
         items = self.server.get_completion_items(document, position)
         self.assertIsInstance(items, list)
     
+    def test_completion_cache_follows_document(self):
+        """Test that cached completions are dropped when the document changes."""
+        position = Position(line=1, character=3)
+        
+        labels = [c.label for c in self.server.get_completion_items(MockDocument('{{ user }}\n{{ '), position)]
+        self.assertIn("user", labels)
+        self.assertEqual(labels, [c.label for c in self.server.get_completion_items(MockDocument('{{ user }}\n{{ '), position)])
+        
+        labels = [c.label for c in self.server.get_completion_items(MockDocument('{{ member }}\n{{ '), position)]
+        self.assertIn("member", labels)
+        self.assertNotIn("user", labels)
+    
+    def test_completion_past_end_of_line(self):
+        """Test that a character past the end of the line completes at the end."""
+        document = MockDocument('<div>\n{{ \n</div>')
+        past_end = self.server.get_completion_items(document, Position(line=1, character=20))
+        at_end = self.server.get_completion_items(document, Position(line=1, character=3))
+        self.assertEqual([c.label for c in past_end], [c.label for c in at_end])
+    
     def test_document_validation(self):
         """Test document validation."""
         # Test valid document
@@ -353,6 +462,109 @@ class TestLanguageServer(unittest.TestCase):
         self.assertIn("user", variables)
         self.assertIn("item", variables)
         self.assertIn("items", variables)
+    
+    def test_void_elements_not_reported(self):
+        """Test that HTML5 void elements are not reported as unclosed."""
+        document = MockDocument('<video><source src="a.mp4"><track src="a.vtt"></video>\n<col><wbr><embed>')
+        self.assertEqual(self.server.validate_document(document), [])
+    
+    def test_unclosed_tag_positions(self):
+        """Test that each unclosed tag is reported at its own position."""
+        diagnostics = self.server.validate_document(MockDocument('<abbr>x</abbr> <a> <a>'))
+        self.assertEqual([d.range.start.character for d in diagnostics], [15, 19])
+        self.assertEqual([d.range.end.character for d in diagnostics], [17, 21])
+    
+    def test_diagnostics_end_before_line_break(self):
+        """Test that unclosed expressions are reported up to the line break."""
+        diagnostics = self.server.validate_document(MockDocument('{{ user.name\r\n<p>ok</p>'))
+        self.assertEqual(len(diagnostics), 1)
+        self.assertEqual(diagnostics[0].range.end.character, len('{{ user.name'))
+    
+    def test_diagnostics_capped(self):
+        """Test that a flood of problems is cut off at the diagnostics limit."""
+        diagnostics = self.server.validate_document(MockDocument('{{ x\n' * 1500))
+        self.assertEqual(len(diagnostics), 1000)
+        self.assertEqual(diagnostics[-1].range.start.line, 999)
+    
+    def test_validation_reuses_line_findings(self):
+        """Test that cached line findings follow lines that moved."""
+        self.server.validate_document(MockDocument('<p>ok</p>\n{{ user.name'))
+        diagnostics = self.server.validate_document(MockDocument('<br>\n<p>ok</p>\n{{ user.name'))
+        
+        self.assertEqual(len(diagnostics), 1)
+        self.assertEqual(diagnostics[0].range.start.line, 2)
+        self.assertEqual(diagnostics[0].message, "Unclosed Jinja2 expression")
+    
+    def test_unchanged_diagnostics_not_republished(self):
+        """Test that identical diagnostics are only published once."""
+        uri = "file:///test.html.j2"
+        with patch.object(self.server, 'publish_diagnostics') as publish:
+            for _ in range(3):
+                self.server.publish_if_changed(uri, self.server.validate_document(MockDocument('{{ user.name')))
+            self.assertEqual(publish.call_count, 1)
+            
+            self.server.publish_if_changed(uri, self.server.validate_document(MockDocument('{{ user.name }}')))
+            self.assertEqual(publish.call_count, 2)
+    
+    def test_validation_debounce(self):
+        """Test that rapid changes are validated once."""
+        workspace = Mock()
+        workspace.get_document.return_value = MockDocument('{{ user.name')
+        
+        async def edit_burst():
+            for _ in range(5):
+                self.server.schedule_validation("file:///test.html.j2", delay=0.01)
+            await asyncio.sleep(0.05)
+        
+        with patch.object(Jinja2HTMLLanguageServer, 'workspace', new_callable=PropertyMock, return_value=workspace), \
+                patch.object(self.server, 'publish_diagnostics') as publish:
+            asyncio.run(edit_burst())
+        
+        self.assertEqual(publish.call_count, 1)
+        self.assertEqual(len(publish.call_args[0][1]), 1)
+    
+    def test_close_during_background_validation(self):
+        """Test that a validation outliving its document leaves nothing cached."""
+        uri = "file:///test.html.j2"
+        workspace = Mock()
+        workspace.get_document.return_value = MockDocument('<p>ok</p>\n' * 600)
+        collect = self.server._collect_diagnostics
+        started, release, finished = threading.Event(), threading.Event(), threading.Event()
+        
+        def slow_collect(document):
+            started.set()
+            release.wait(5)
+            try:
+                return collect(document)
+            finally:
+                finished.set()
+        
+        async def close_while_validating():
+            loop = asyncio.get_running_loop()
+            self.server.schedule_validation(uri, delay=0)
+            await loop.run_in_executor(None, started.wait, 5)
+            self.server.forget_document(uri)
+            release.set()
+            await loop.run_in_executor(None, finished.wait, 5)
+            await asyncio.sleep(0)
+        
+        with patch.object(Jinja2HTMLLanguageServer, 'workspace', new_callable=PropertyMock, return_value=workspace), \
+                patch.object(self.server, '_collect_diagnostics', side_effect=slow_collect), \
+                patch.object(self.server, 'publish_diagnostics') as publish:
+            asyncio.run(close_while_validating())
+        
+        self.assertNotIn(uri, self.server._document_cache)
+        publish.assert_not_called()
+    
+    def test_unchanged_source_not_revalidated(self):
+        """Test that a document is not validated again until its source changes."""
+        document = MockDocument('{{ user.name')
+        with patch.object(self.server, 'publish_diagnostics'):
+            self.server.validate_and_publish(document)
+        self.assertTrue(self.server.is_validated(document))
+        
+        document.source = '{{ user.name }}'
+        self.assertFalse(self.server.is_validated(document))
 
 
 class TestLSPProtocol(unittest.TestCase):
@@ -405,14 +617,40 @@ class TestLSPProtocol(unittest.TestCase):
             if result is not None:
                 self.assertIsNotNone(result.contents)
 
+    
+    def test_stdin_read_in_chunks(self):
+        """Test that messages arriving together are read at once and all handled."""
+        body = b'{"jsonrpc": "2.0", "method": "initialized", "params": {}}'
+        message = b'Content-Length: %d\r\n\r\n%s' % (len(body), body)
+        rfile = io.BytesIO(message * 2)
+        language_server = Jinja2HTMLLanguageServer()
+        chunks = []
+        
+        def receive(data):
+            chunks.append(data)
+            language_server.lsp.data_received(data)
+        
+        async def read():
+            await _read_chunks(asyncio.get_running_loop(), None, threading.Event(), rfile, receive)
+        
+        with patch.object(language_server.lsp, '_procedure_handler') as handle:
+            asyncio.run(read())
+        
+        self.assertEqual(chunks, [message * 2])
+        self.assertEqual(handle.call_count, 2)
 
 class TestIntegration(unittest.TestCase):
     """Integration tests for the complete system."""
     
-    def setUp(self):
-        self.server = Jinja2HTMLLanguageServer()
-        self.provider = self.server.completion_provider
-        self.emmet = self.server.emmet
+    @classmethod
+    def setUpClass(cls):
+        # Tests share one server; per-document state is dropped after each
+        cls.server = Jinja2HTMLLanguageServer()
+        cls.provider = cls.server.completion_provider
+        cls.emmet = cls.server.emmet
+    
+    def tearDown(self):
+        self.server.forget_document("file:///test.html.j2")
     
     def test_html_emmet_completion_flow(self):
         """Test complete HTML + Emmet completion flow."""
@@ -539,35 +777,48 @@ def run_performance_tests():
     server = Jinja2HTMLLanguageServer()
     document = MockDocument(large_template)
     
-    # Test completion performance
-    start_time = time.time()
-    for i in range(10):
-        position = Position(line=10 + i, character=20)
+    # Warm up on tiny inputs so the timings below are steady state: the
+    # provider tables are built on first use, and the small documents
+    # leave nothing cached for the large one
+    server.completion_provider._extract_variables("{{ x }}")
+    server.validate_document(MockDocument("", uri="file:///warmup.html.j2"))
+    server.get_completion_items(MockDocument("<d", uri="file:///warmup.html.j2"), Position(line=0, character=2))
+    print("Times below are measured after warmup")
+    
+    # Test completion performance; positions are built outside the timing
+    positions = [Position(line=10 + i, character=20) for i in range(10)]
+    start_time = time.perf_counter()
+    for position in positions:
         completions = server.get_completion_items(document, position)
-    completion_time = time.time() - start_time
+    completion_time = time.perf_counter() - start_time
     
     print(f"Completion time for 10 requests on large document: {completion_time:.3f}s")
     
-    # Test validation performance
-    start_time = time.time()
+    # Test validation performance; the per-line findings and the shared
+    # diagnostics are dropped before each run, so every run starts cold
+    start_time = time.perf_counter()
     for i in range(5):
+        server._document_cache.pop(document.uri, None)
+        _make_diagnostic.cache_clear()
         diagnostics = server.validate_document(document)
-    validation_time = time.time() - start_time
+    validation_time = time.perf_counter() - start_time
     
-    print(f"Validation time for 5 runs on large document: {validation_time:.3f}s")
+    print(f"Validation time for 5 cold runs on large document: {validation_time:.3f}s")
     
-    # Test variable extraction performance
-    start_time = time.time()
+    # Test variable extraction performance; extraction is memoized by
+    # content, so the cache is cleared to time a full extraction each run
+    start_time = time.perf_counter()
     for i in range(10):
+        server.completion_provider._document_names_cache.cache_clear()
         variables = server.completion_provider._extract_variables(large_template)
-    extraction_time = time.time() - start_time
+    extraction_time = time.perf_counter() - start_time
     
-    print(f"Variable extraction time for 10 runs: {extraction_time:.3f}s")
+    print(f"Variable extraction time for 10 cold runs: {extraction_time:.3f}s")
     print(f"Variables found: {len(variables)}")
 
 
 def main():
-    """Run all tests."""
+    """Run all tests, and the performance tests when --perf is given."""
     print("Jinja2 HTML Language Server - Test Suite")
     print("="*50)
     
@@ -593,8 +844,10 @@ def main():
     runner = unittest.TextTestRunner(verbosity=2)
     result = runner.run(test_suite)
     
-    # Run performance tests
-    run_performance_tests()
+    # Performance tests only time things and assert nothing, so they
+    # run on request
+    if '--perf' in sys.argv[1:]:
+        run_performance_tests()
     
     # Print summary
     print("\n" + "="*50)
@@ -13,6 +13,8 @@ from pathlib import Path
 import tempfile
 import os
 
+from diagnose import list_directory
+
 def test_extension_structure():
     """Test that the extension has the correct directory structure."""
     print("🔍 Testing extension structure...")
@@ -24,9 +26,14 @@ def test_extension_structure():
         "server/__init__.py"
     ]
 
+    # Look each file up in its parent's listing, fetched once per directory
+    listings = {}
     missing_files = []
     for file_path in required_files:
-        if not Path(file_path).exists():
+        path = Path(file_path)
+        if path.parent not in listings:
+            listings[path.parent] = list_directory(path.parent)
+        if path.name not in listings[path.parent]:
             missing_files.append(file_path)
 
     if missing_files:
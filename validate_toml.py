@@ -6,11 +6,17 @@ This script validates the extension.toml file and provides detailed error report
 to help debug issues with Zed extension configuration.
 """
 
+import argparse
+import io
+import os
 import sys
 import tomllib
 from pathlib import Path
 
-def validate_extension_toml(toml_path="extension.toml"):
+# Fields every Zed extension.toml must define, in the order they're reported
+REQUIRED_FIELDS = ('id', 'name', 'version', 'schema_version', 'authors', 'description')
+
+def validate_extension_toml(toml_path="extension.toml", verbose=False):
     """Validate the extension.toml file and report any issues."""
     
     toml_file = Path(toml_path)
@@ -26,12 +32,7 @@ def validate_extension_toml(toml_path="extension.toml"):
         print(f"✅ {toml_path} is syntactically valid TOML")
         
         # Check required fields for Zed extensions
-        required_fields = ['id', 'name', 'version', 'schema_version', 'authors', 'description']
-        missing_fields = []
-        
-        for field in required_fields:
-            if field not in data:
-                missing_fields.append(field)
+        missing_fields = [field for field in REQUIRED_FIELDS if field not in data]
         
         if missing_fields:
             print(f"⚠️  Warning: Missing required fields: {', '.join(missing_fields)}")
@@ -41,43 +42,60 @@ def validate_extension_toml(toml_path="extension.toml"):
         # Validate specific sections
         if 'language_servers' in data:
             print(f"✅ Found {len(data['language_servers'])} language server(s)")
-            for name, config in data['language_servers'].items():
-                print(f"   - {name}: {config.get('name', 'No name')}")
+            lines = [
+                f"   - {name}: {config.get('name', 'No name')}"
+                for name, config in data['language_servers'].items()
+            ]
+            if lines:
+                print("\n".join(lines))
         
         if 'grammars' in data:
             print(f"✅ Found {len(data['grammars'])} grammar(s)")
+            lines = []
             for name, config in data['grammars'].items():
-                if 'repository' in config and 'rev' in config:
-                    print(f"   - {name}: {config['repository']} @ {config['rev']}")
+                if {'repository', 'rev'} <= config.keys():
+                    lines.append(f"   - {name}: {config['repository']} @ {config['rev']}")
                 elif 'path' in config:
-                    print(f"   - {name}: local path {config['path']}")
+                    lines.append(f"   - {name}: local path {config['path']}")
                 else:
-                    print(f"   - {name}: ⚠️  Missing repository/rev or path")
+                    lines.append(f"   - {name}: ⚠️  Missing repository/rev or path")
+            if lines:
+                print("\n".join(lines))
         
         # Check for languages directory
-        languages_dir = Path("languages")
-        if languages_dir.exists():
-            language_dirs = [d for d in languages_dir.iterdir() if d.is_dir()]
+        # DirEntry.is_dir() answers from the directory listing, and opening
+        # config.toml directly replaces a separate exists() stat
+        try:
+            with os.scandir("languages") as it:
+                language_dirs = [entry for entry in it if entry.is_dir()]
+        except FileNotFoundError:
+            print("ℹ️  No languages/ directory found")
+        else:
             print(f"✅ Found {len(language_dirs)} language(s) in languages/ directory")
             for lang_dir in language_dirs:
-                config_file = lang_dir / "config.toml"
-                if config_file.exists():
-                    print(f"   - {lang_dir.name}: config.toml found")
-                    try:
-                        with open(config_file, 'rb') as f:
-                            lang_config = tomllib.load(f)
-                        print(f"     Name: {lang_config.get('name', 'Unknown')}")
-                        print(f"     Grammar: {lang_config.get('grammar', 'None')}")
-                        print(f"     Extensions: {lang_config.get('path_suffixes', [])}")
-                    except Exception as e:
-                        print(f"     ❌ Error reading config.toml: {e}")
-                else:
+                try:
+                    config_file = open(os.path.join(lang_dir.path, "config.toml"), 'rb')
+                except FileNotFoundError:
                     print(f"   - {lang_dir.name}: ❌ Missing config.toml")
-        else:
-            print("ℹ️  No languages/ directory found")
+                    continue
+                except OSError as e:
+                    print(f"   - {lang_dir.name}: ❌ Error opening config.toml: {e}")
+                    continue
+                print(f"   - {lang_dir.name}: config.toml found")
+                try:
+                    with config_file:
+                        lang_config = tomllib.load(config_file)
+                    print(f"     Name: {lang_config.get('name', 'Unknown')}")
+                    print(f"     Grammar: {lang_config.get('grammar', 'None')}")
+                    print(f"     Extensions: {lang_config.get('path_suffixes', [])}")
+                except Exception as e:
+                    print(f"     ❌ Error reading config.toml: {e}")
         
-        print("\n📋 Full parsed structure:")
-        print_dict(data, indent=0)
+        if verbose:
+            print("\n📋 Full parsed structure:")
+            buf = io.StringIO()
+            print_dict(data, indent=0, out=buf)
+            sys.stdout.write(buf.getvalue())
         
         return True
         
@@ -88,24 +106,31 @@ def validate_extension_toml(toml_path="extension.toml"):
         print(f"❌ Error reading file: {e}")
         return False
 
-def print_dict(d, indent=0):
-    """Pretty print a dictionary with indentation."""
+def print_dict(d, indent=0, out=None):
+    """Pretty print a dictionary with indentation to out (default stdout)."""
+    if out is None:
+        out = sys.stdout
+    prefix = "  " * indent
+    next_indent = indent + 1
     for key, value in d.items():
         if isinstance(value, dict):
-            print("  " * indent + f"{key}:")
-            print_dict(value, indent + 1)
-        elif isinstance(value, list):
-            print("  " * indent + f"{key}: {value}")
+            out.write(f"{prefix}{key}:\n")
+            print_dict(value, next_indent, out)
         else:
-            print("  " * indent + f"{key}: {value}")
+            out.write(f"{prefix}{key}: {value}\n")
 
 if __name__ == "__main__":
-    toml_file = sys.argv[1] if len(sys.argv) > 1 else "extension.toml"
+    parser = argparse.ArgumentParser(description="Validate a Zed extension.toml file")
+    parser.add_argument("toml_file", nargs="?", default="extension.toml",
+                        help="path to extension.toml (default: extension.toml)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="also print the full parsed structure")
+    args = parser.parse_args()
     
     print("🔍 Zed Extension TOML Validator")
     print("=" * 40)
     
-    success = validate_extension_toml(toml_file)
+    success = validate_extension_toml(args.toml_file, verbose=args.verbose)
     
     if success:
         print("\n✅ Validation completed successfully!")